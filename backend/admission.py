@@ -0,0 +1,69 @@
+from collections import OrderedDict
+import threading
+import time
+
+# 令牌桶：容量为burst，每秒补充rate个令牌
+class _Bucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, tokens, updated):
+        self.tokens = tokens
+        self.updated = updated
+
+# 进程内的准入控制：按事件类型分别对每个用户、每个IP做令牌桶限流
+# limits 格式为 {事件: {'user': (每秒速率, 突发容量), 'ip': (每秒速率, 突发容量)}}，未配置的事件或维度不限制
+# 在任何数据库操作之前调用allow，被拒绝的请求只计数，不做其他处理
+# 注意：只限制当前进程，多进程部署时每个进程分别计算
+class AdmissionControl:
+    def __init__(self, limits, max_buckets=100000):
+        self.limits = limits
+        self.max_buckets = max_buckets
+        # (事件, 维度, 用户ID或IP) -> 令牌桶，超过max_buckets时按LRU淘汰
+        # 被淘汰的桶重新创建时是满的，只会对最久未请求的用户或IP略微放宽
+        self._buckets = OrderedDict()
+        # 事件 -> {'allowed': 通过数, 'rejected_user': 按用户拒绝数, 'rejected_ip': 按IP拒绝数}
+        self._counters = {event: {'allowed': 0, 'rejected_user': 0, 'rejected_ip': 0} for event in limits}
+        self._lock = threading.Lock()
+
+    # 检查一次请求能否通过，返回 (是否通过, 建议的重试等待秒数)
+    # 同时检查用户和IP两个维度，任一维度不足时都不消耗令牌
+    def allow(self, event, user_id=None, ip=None):
+        limits = self.limits.get(event)
+        if not limits:
+            return True, 0
+        checks = [
+            (scope, key, limits[scope])
+            for scope, key in (('user', user_id), ('ip', ip))
+            if key is not None and scope in limits
+        ]
+        now = time.monotonic()
+        with self._lock:
+            buckets = [self._refill(event, scope, key, limit, now) for scope, key, limit in checks]
+            for (scope, _, limit), bucket in zip(checks, buckets):
+                if bucket.tokens < 1:
+                    self._counters[event]['rejected_' + scope] += 1
+                    return False, (1 - bucket.tokens) / limit[0]
+            for bucket in buckets:
+                bucket.tokens -= 1
+            self._counters[event]['allowed'] += 1
+        return True, 0
+
+    # 各事件的通过和拒绝计数
+    def stats(self):
+        with self._lock:
+            return {event: dict(counters) for event, counters in self._counters.items()}
+
+    # 获取令牌桶并按经过的时间补充令牌（调用方需持有锁）
+    def _refill(self, event, scope, key, limit, now):
+        rate, burst = limit
+        bucket_key = (event, scope, key)
+        bucket = self._buckets.get(bucket_key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                self._buckets.popitem(last=False)
+            bucket = self._buckets[bucket_key] = _Bucket(burst, now)
+        else:
+            bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+            bucket.updated = now
+            self._buckets.move_to_end(bucket_key)
+        return bucket
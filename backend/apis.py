@@ -1,15 +1,22 @@
-import requests
+from string import Template
+import heapq
+import itertools
 import json
-with open('api-config.json', 'r') as f:
-    config = json.load(f)
-def send_verify_email(email, code):
-    r = requests.post('https://api.sendcloud.net/apiv2/mail/send', data={
-    'apiUser': config['apiUser'],
-    'apiKey': config['apiKey'],
-    'from': 'CAN_CHAT-Verify@qq.com',
-    'to': email,
-    'subject': 'Verifiy your email address',
-    'html': '''
+import threading
+import time
+
+import requests
+
+from app_logging import describe_error, get_logger
+
+logger = get_logger(__name__)
+
+SENDCLOUD_URL = 'https://api.sendcloud.net/apiv2/mail/send'
+VERIFY_EMAIL_FROM = 'CAN_CHAT-Verify@qq.com'
+VERIFY_EMAIL_SUBJECT = 'Verifiy your email address'
+
+# 验证码邮件模板（模块加载时编译一次）
+VERIFY_EMAIL_TEMPLATE = Template('''
         <!DOCTYPE html>
         <html lang="zh-CN">
         <head>
@@ -55,7 +62,7 @@ def send_verify_email(email, code):
                         <td class="verify-card" style="padding: 30px 35px; text-align: center;">
                         <p style="margin: 0; font-size: 15px; color: #333333; line-height: 1.6;">尊敬的用户，你正在进行邮箱验证，本次验证码为：</p>
                         <!-- 验证码高亮卡片 - 重中之重 -->
-                        <p class="code-box" style="margin: 20px auto; padding: 15px 0; width: 90%; background-color: #f0f7ff; border-radius: 12px; font-size: 28px; font-weight: 700; color: #165DFF; letter-spacing: 12px; font-family: 'Courier New', monospace;">'''+ code +'''</p>
+                        <p class="code-box" style="margin: 20px auto; padding: 15px 0; width: 90%; background-color: #f0f7ff; border-radius: 12px; font-size: 28px; font-weight: 700; color: #165DFF; letter-spacing: 12px; font-family: 'Courier New', monospace;">${code}</p>
                         <!-- 重要提示 -->
                         <p style="margin: 0; font-size: 13px; color: #999999; line-height: 1.6;">验证码有效期为 <strong style="color: #ff4d4f; font-weight: 500;">5分钟</strong>，请尽快完成验证</p>
                         </td>
@@ -81,5 +88,120 @@ def send_verify_email(email, code):
         </table>
         </body>
         </html>
-        '''
-    })
\ No newline at end of file
+        ''')
+
+# 渲染验证码邮件
+def render_verify_email(code):
+    return VERIFY_EMAIL_TEMPLATE.substitute(code=code)
+
+# 通过SendCloud发送邮件，复用HTTP连接
+class SendCloudTransport:
+    def __init__(self, config_path='api-config.json', timeout=10):
+        with open(config_path, 'r') as f:
+            self.config = json.load(f)
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def send(self, to, subject, html):
+        r = self.session.post(SENDCLOUD_URL, data={
+            'apiUser': self.config['apiUser'],
+            'apiKey': self.config['apiKey'],
+            'from': VERIFY_EMAIL_FROM,
+            'to': to,
+            'subject': subject,
+            'html': html
+        }, timeout=self.timeout)
+        r.raise_for_status()
+        result = r.json()
+        if not result.get('result'):
+            raise RuntimeError(f"SendCloud发送失败: {result.get('message')}")
+
+# 本地假发送：只记录邮件，用于开发和测试
+class FakeTransport:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, to, subject, html):
+        self.sent.append({'to': to, 'subject': subject, 'html': html})
+
+EMAIL_TRANSPORTS = {
+    'sendcloud': SendCloudTransport,
+    'fake': FakeTransport
+}
+
+# 根据名称创建邮件发送方式
+def create_transport(name):
+    if name not in EMAIL_TRANSPORTS:
+        raise ValueError(f'未知的邮件发送方式: {name}')
+    return EMAIL_TRANSPORTS[name]()
+
+# 邮件发件箱：请求中只负责入队，由后台线程发送，失败时按指数退避重试
+class EmailOutbox:
+    def __init__(self, transport, max_queue=1000, max_attempts=4, backoff=1.0):
+        self.transport = transport
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        # 待发送邮件：(计划发送时间, 序号, 邮件)
+        self._pending = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    # 启动后台发送线程
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='email-outbox', daemon=True)
+            self._thread.start()
+
+    # 邮件入队，队列已满时返回False
+    def enqueue(self, to, subject, html):
+        email = {'to': to, 'subject': subject, 'html': html, 'attempts': 0}
+        with self._cond:
+            if self._stopped or len(self._pending) >= self.max_queue:
+                return False
+            heapq.heappush(self._pending, (time.monotonic(), next(self._counter), email))
+            self._cond.notify()
+        return True
+
+    # 发送验证码邮件
+    def send_verify_email(self, email, code):
+        return self.enqueue(email, VERIFY_EMAIL_SUBJECT, render_verify_email(code))
+
+    # 停止后台线程，退出前尝试发送剩余邮件
+    def shutdown(self, timeout=10):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    if self._pending and (self._stopped or self._pending[0][0] <= now):
+                        break
+                    if self._stopped:
+                        return
+                    timeout = self._pending[0][0] - now if self._pending else None
+                    self._cond.wait(timeout)
+                _, _, email = heapq.heappop(self._pending)
+                stopping = self._stopped
+            self._deliver(email, retry=not stopping)
+
+    # 发送一封邮件，失败时重新安排发送
+    def _deliver(self, email, retry=True):
+        email['attempts'] += 1
+        try:
+            self.transport.send(email['to'], email['subject'], email['html'])
+        except Exception as e:
+            if not retry or email['attempts'] >= self.max_attempts:
+                logger.error('email_failed', email=email['to'], attempts=email['attempts'], error=describe_error(e))
+                return
+            delay = self.backoff * 2 ** (email['attempts'] - 1)
+            logger.warning('email_retry', email=email['to'], attempts=email['attempts'], delay=delay, error=describe_error(e))
+            with self._cond:
+                heapq.heappush(self._pending, (time.monotonic() + delay, next(self._counter), email))
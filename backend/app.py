@@ -2,41 +2,313 @@ from flask import Flask, jsonify, request, render_template, session, redirect, u
 from flask_cors import CORS
 from flask_socketio import SocketIO, join_room, leave_room, emit
 from flask_migrate import Migrate
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.routing import IntegerConverter
+import click
 from models import db, User, Channel, UserChannel, Message
 from datetime import datetime, timedelta
 import os
-import uuid
+import atexit
+import hmac
+import math
 import random
-from werkzeug.utils import secure_filename
-from apis import send_verify_email
+from apis import EmailOutbox, create_transport
+from serializers import message_query, serialize_message, serialize_senders, serialize_profile, get_sender, build_message_payload, serialize_channel
+from membership import MembershipCache
+from message_writer import MessageWriter, WriteQueueFull
+from db_profiles import configure_database, apply_engine_profile, describe_engine
+from message_search import ensure_search_index, rebuild_search_index, search_messages, search_terms
+from channel_search import ensure_channel_index, rebuild_channel_index, search_public_channels, SearchCache
+from socket_queue import socketio_queue_options
+from media import MediaPipeline
+from presence import PresenceRegistry
+from last_seen import LastSeenTracker
+from recent_messages import RecentMessages
+from read_markers import ReadMarkerTracker, latest_message_id, joined_channels_with_unread
+from storage import BlobStore
+from static_assets import StaticAssets, compress_static
+from admission import AdmissionControl
+from datagen import generate_dataset
+from metrics import AppMetrics
+from query_accounting import QueryAccounting
+from app_logging import configure_logging, get_logger, parse_mapping
 
 # 创建Flask应用
 app = Flask(__name__, template_folder='../templates', static_folder='../static')
 
 # 配置
 app.config['SECRET_KEY'] = 'can-chat-secret-key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///../chat.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# 数据库配置（DATABASE_URL 指定地址，DB_PROFILE 选择引擎配置档）
+db_profile = configure_database(app)
+
 # 文件上传配置
 app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static', 'img', 'avatars')
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
+# 上传文件按内容哈希去重存储的目录（相对于项目根目录）
+app.config['UPLOAD_BLOB_DIR'] = 'static/img/uploads'
+
+# 消息写入配置：sync 每条消息单独提交；batched 先广播后由后台线程批量提交
+app.config['MESSAGE_WRITE_MODE'] = os.environ.get('MESSAGE_WRITE_MODE', 'sync')
+app.config['MESSAGE_BATCH_SIZE'] = 100
+app.config['MESSAGE_FLUSH_INTERVAL'] = 0.005  # 秒
+app.config['MESSAGE_QUEUE_SIZE'] = 10000
+
+# 跨进程广播的消息队列地址，多个工作进程共享房间时设置
+# 例如 redis://localhost:6379/0，或单机使用 unix:///tmp/can-chat-sockets
+app.config['SOCKETIO_MESSAGE_QUEUE'] = os.environ.get('SOCKETIO_MESSAGE_QUEUE', '')
+
+# SQL语句统计：单个请求的数据库总耗时超过阈值（秒）时输出慢查询报告；
+# 同一语句在一个请求中执行超过 QUERY_REPEAT_LIMIT 次时按 QUERY_REPEAT_ACTION 处理（off/warn/raise），
+# 未设置时测试模式下抛出异常，调试模式下警告
+app.config['SLOW_QUERY_THRESHOLD'] = float(os.environ.get('SLOW_QUERY_THRESHOLD', '0.1'))
+app.config['QUERY_REPEAT_LIMIT'] = int(os.environ.get('QUERY_REPEAT_LIMIT', '10'))
+app.config['QUERY_REPEAT_ACTION'] = os.environ.get('QUERY_REPEAT_ACTION', '')
+
+# 日志配置：LOG_LEVEL 全局级别；LOG_FORMAT 为 json（每行一条JSON）或 text；
+# LOG_EVENT_LEVELS 按事件覆盖级别，如 message_sent=INFO；LOG_SAMPLE_RATES 按事件设置采样率，如 socket_connected=1
+app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO')
+app.config['LOG_FORMAT'] = os.environ.get('LOG_FORMAT', 'json')
+app.config['LOG_EVENT_LEVELS'] = os.environ.get('LOG_EVENT_LEVELS', '')
+app.config['LOG_SAMPLE_RATES'] = os.environ.get('LOG_SAMPLE_RATES', '')
+
+# 应用前的反向代理（负载均衡）层数，设置后从 X-Forwarded-For / X-Forwarded-Proto 中取客户端地址，
+# 否则所有客户端都是代理的地址，按IP限流会把全部用户算作同一个IP
+app.config['PROXY_HOPS'] = int(os.environ.get('PROXY_HOPS', '0'))
+
+# 运行指标接口的访问令牌（请求头 Authorization: Bearer <令牌>），未设置时只允许本机直接访问
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+
+# 邮件发送方式：sendcloud 或 fake（只记录不发送，用于开发和测试）
+app.config['EMAIL_TRANSPORT'] = os.environ.get('EMAIL_TRANSPORT', 'sendcloud')
+
+# 图片消息后台处理（缩略图、压缩图）的并发任务数和队列长度
+MEDIA_WORKERS = 2
+MEDIA_QUEUE_SIZE = 100
+
+# 在线状态变化的广播间隔（同一间隔内的变化合并为一个presence_diff事件）
+PRESENCE_INTERVAL = 1.0  # 秒
+
+# 用户最后活跃时间批量写入数据库的间隔
+LAST_SEEN_FLUSH_INTERVAL = 5  # 秒
+
+# 已读位置批量写入数据库的间隔
+READ_MARKER_FLUSH_INTERVAL = 2  # 秒
+
+# 频道最近消息缓存（最新一页历史记录、断线重连后补发错过的消息）
+RECENT_MESSAGES_PER_CHANNEL = 200
+RECENT_MESSAGES_MAX_CHANNELS = 1000
+RECENT_MESSAGES_MAX_BYTES = 64 * 1024 * 1024
+# 重连时单次最多补发的消息数，超过时客户端重新加载历史
+REPLAY_MAX_MESSAGES = 500
+
+# 频道成员关系缓存的最大用户数
+MEMBERSHIP_CACHE_MAX_USERS = 10000
+# 多进程部署时缓存条目的有效期，使其他进程中的退出操作在有限时间内生效
+MEMBERSHIP_CACHE_TTL = 60  # 秒
+
+# 数据库整数列的最大值（SQLite INTEGER为64位），超出的ID和偏移量会使查询出错
+DB_INT_MAX = 2**63 - 1
+
+# 路由中的整数参数（<int:channel_id>）不超过数据库整数范围，超出时返回404
+class BoundedIntegerConverter(IntegerConverter):
+    def __init__(self, map, *args, **kwargs):
+        kwargs.setdefault('max', DB_INT_MAX)
+        super().__init__(map, *args, **kwargs)
+
+app.url_map.converters['int'] = BoundedIntegerConverter
+
+# 消息内容的最大长度（字符）
+MESSAGE_MAX_LENGTH = 5000
+
+# 消息历史分页配置
+MESSAGE_PAGE_SIZE = 50
+MESSAGE_PAGE_SIZE_MAX = 200
+
+# 消息搜索分页配置
+SEARCH_PAGE_SIZE = 20
+SEARCH_PAGE_SIZE_MAX = 100
+
+# 批量获取用户资料时单次最多的用户数
+USER_PROFILE_BATCH_MAX = 100
+
+# 发送消息和上传的准入控制：{事件: {'user'/'ip': (每秒补充的令牌数, 突发容量)}}
+# 超出时HTTP接口返回429，Socket.IO事件返回error，均在数据库操作之前拒绝
+RATE_LIMITS = {
+    'send_message': {'user': (5, 20), 'ip': (20, 60)},
+    'send_image_message': {'user': (0.5, 5), 'ip': (2, 15)},
+    'upload_avatar': {'user': (0.1, 3), 'ip': (0.5, 10)},
+}
+# 准入控制最多保留的令牌桶数量（按LRU淘汰）
+RATE_LIMIT_MAX_BUCKETS = 100000
+
+# 运行指标中按频道输出在线人数的频道数量（在线人数最多的频道）
+METRICS_TOP_ROOMS = 20
+
+# 高频事件的默认日志级别和采样率，可由 LOG_EVENT_LEVELS / LOG_SAMPLE_RATES 覆盖
+LOG_EVENT_LEVELS = {'message_sent': 'DEBUG'}
+LOG_SAMPLE_RATES = {'socket_connected': 0.1, 'socket_disconnected': 0.1, 'message_sent': 0.01}
+# 日志队列长度，写出跟不上时丢弃新的记录
+LOG_QUEUE_SIZE = 10000
+
+# 频道搜索结果缓存配置
+CHANNEL_SEARCH_CACHE_TTL = 10  # 秒
+CHANNEL_SEARCH_CACHE_SIZE = 1000
+
+# 日志经队列由后台线程写出，处理消息的线程不等待输出；最先注册atexit，最后停止以写出其他组件退出时的日志
+log_handler, log_listener = configure_logging(
+    level=app.config['LOG_LEVEL'],
+    event_levels={**LOG_EVENT_LEVELS, **parse_mapping(app.config['LOG_EVENT_LEVELS'])},
+    sample_rates={**LOG_SAMPLE_RATES, **parse_mapping(app.config['LOG_SAMPLE_RATES'], float)},
+    log_format=app.config['LOG_FORMAT'],
+    queue_size=LOG_QUEUE_SIZE
+)
+atexit.register(log_listener.stop)
+logger = get_logger(__name__)
 
 # 确保上传目录存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# 上传文件去重存储
+blob_store = BlobStore(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), app.config['UPLOAD_BLOB_DIR'])
+
+# 静态文件缓存与预压缩（上传文件位于静态目录下的 UPLOAD_BLOB_DIR）
+static_assets = StaticAssets(app, uploads_prefix=app.config['UPLOAD_BLOB_DIR'].removeprefix('static/') + '/')
+
 # 初始化扩展
 CORS(app, supports_credentials=True)
 db.init_app(app)
-socketio = SocketIO(app, cors_allowed_origins='*', supports_credentials=True)
+socketio = SocketIO(app, cors_allowed_origins='*', supports_credentials=True,
+                    **socketio_queue_options(app.config['SOCKETIO_MESSAGE_QUEUE']))
+
+# 信任反向代理转发的客户端地址（包在Socket.IO中间件外层，连接事件中的request.remote_addr同样生效）
+if app.config['PROXY_HOPS']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_HOPS'], x_proto=app.config['PROXY_HOPS'])
 
 # 初始化Flask-Migrate
 migrate = Migrate(app, db)
 
+# 频道成员关系缓存（进程内）
+membership_cache = MembershipCache(
+    max_users=MEMBERSHIP_CACHE_MAX_USERS,
+    ttl=MEMBERSHIP_CACHE_TTL if app.config['SOCKETIO_MESSAGE_QUEUE'] else None
+)
+
+# 准入控制（进程内令牌桶）
+admission = AdmissionControl(RATE_LIMITS, max_buckets=RATE_LIMIT_MAX_BUCKETS)
+
+# 频道搜索结果缓存（进程内）
+channel_search_cache = SearchCache(ttl=CHANNEL_SEARCH_CACHE_TTL, max_entries=CHANNEL_SEARCH_CACHE_SIZE)
+
+# 批量写入模式在各进程中预留不同的ID段，多进程部署时消息ID不再随提交顺序递增，
+# 而未读数量、重连补发和分页都依赖ID的先后顺序，因此不能与跨进程消息队列同时使用
+if app.config['MESSAGE_WRITE_MODE'] == 'batched' and app.config['SOCKETIO_MESSAGE_QUEUE']:
+    raise ValueError('批量写入模式（MESSAGE_WRITE_MODE=batched）不能与多进程部署（SOCKETIO_MESSAGE_QUEUE）同时使用')
+
+# 消息写入管道，进程退出时写入剩余消息
+message_writer = MessageWriter(
+    app,
+    mode=app.config['MESSAGE_WRITE_MODE'],
+    batch_size=app.config['MESSAGE_BATCH_SIZE'],
+    flush_interval=app.config['MESSAGE_FLUSH_INTERVAL'],
+    max_queue=app.config['MESSAGE_QUEUE_SIZE']
+)
+message_writer.start()
+atexit.register(message_writer.shutdown)
+
+# 邮件发件箱，验证码邮件由后台线程发送
+email_outbox = EmailOutbox(create_transport(app.config['EMAIL_TRANSPORT']))
+email_outbox.start()
+atexit.register(email_outbox.shutdown)
+
+# 用户最后活跃时间（合并写入）
+last_seen = LastSeenTracker(app, flush_interval=LAST_SEEN_FLUSH_INTERVAL)
+last_seen.start()
+atexit.register(last_seen.shutdown)
+
+# 频道最近消息缓存，只包含本进程广播的消息，配置了跨进程消息队列时不启用
+recent_messages = RecentMessages(
+    per_channel=RECENT_MESSAGES_PER_CHANNEL,
+    max_channels=RECENT_MESSAGES_MAX_CHANNELS,
+    max_bytes=RECENT_MESSAGES_MAX_BYTES,
+    enabled=not app.config['SOCKETIO_MESSAGE_QUEUE']
+)
+
+# 频道已读位置（合并写入）
+read_markers = ReadMarkerTracker(app, flush_interval=READ_MARKER_FLUSH_INTERVAL)
+read_markers.start()
+atexit.register(read_markers.shutdown)
+
+# 图片消息处理管道（生成缩略图后同步更新最近消息缓存）
+media_pipeline = MediaPipeline(
+    app, socketio, workers=MEDIA_WORKERS, max_queue=MEDIA_QUEUE_SIZE,
+    on_ready=recent_messages.update_message
+)
+media_pipeline.start()
+
+# 在线状态登记
+presence = PresenceRegistry(socketio, interval=PRESENCE_INTERVAL)
+presence.start()
+
 # 创建数据库表
 with app.app_context():
+    apply_engine_profile(db.engine, db_profile)
     db.create_all()
+    app.config['MESSAGE_SEARCH_ENABLED'] = ensure_search_index(db.engine)
+    app.config['CHANNEL_SEARCH_INDEXED'] = ensure_channel_index(db.engine)
+    logger.info('database_configured', engine=describe_engine(db.engine, app.config['DB_PROFILE']))
+
+# SQL语句统计（慢查询报告、N+1检查）
+query_accounting = QueryAccounting(
+    slow_threshold=app.config['SLOW_QUERY_THRESHOLD'],
+    repeat_limit=app.config['QUERY_REPEAT_LIMIT'],
+    repeat_action=app.config['QUERY_REPEAT_ACTION'] or None
+)
+with app.app_context():
+    query_accounting.init_app(app, db.engine)
+
+# 运行指标：请求和Socket.IO事件的耗时、SQL语句数量等，由 /api/metrics 输出
+metrics = AppMetrics()
+metrics.init_app(app)
+
+# 在线人数最多的频道：{(频道ID,): 在线用户数}
+def top_room_sizes():
+    sizes = sorted(presence.room_sizes().items(), key=lambda item: item[1], reverse=True)
+    return {(channel_id,): size for channel_id, size in sizes[:METRICS_TOP_ROOMS]}
+
+# 准入控制计数：{(事件, 结果): 次数}
+def admission_counts():
+    return {
+        (event, result): count
+        for event, counters in admission.stats().items()
+        for result, count in counters.items()
+    }
+
+metrics.registry.collected('socketio_connections', '当前进程的Socket.IO连接数',
+                           lambda: {(): presence.connection_count()})
+metrics.registry.collected('chat_rooms_online', '有在线用户的频道数',
+                           lambda: {(): len(presence.room_sizes())})
+metrics.registry.collected('chat_room_online_users', f'在线用户最多的{METRICS_TOP_ROOMS}个频道的在线用户数',
+                           top_room_sizes, ('channel_id',))
+metrics.registry.collected('admission_requests_total', '准入控制的通过和拒绝次数',
+                           admission_counts, ('event', 'result'), kind='counter')
+metrics.registry.collected('message_write_queue_size', '等待批量写入数据库的消息数',
+                           lambda: {(): message_writer.queue_size()})
+metrics.registry.collected('media_queue_size', '等待生成缩略图的图片数',
+                           lambda: {(): media_pipeline.queue_size()})
+metrics.registry.collected('recent_messages_cache_bytes', '最近消息缓存的估算内存占用',
+                           lambda: {(): recent_messages.stats()[2]})
+metrics.registry.collected('log_records_dropped_total', '日志队列已满时丢弃的日志记录数',
+                           lambda: {(): log_handler.dropped}, kind='counter')
+
+# 注册Socket.IO事件处理函数，同时统计处理次数、耗时和SQL语句
+def socket_event(name):
+    def decorator(handler):
+        tracked = metrics.track_socket_event(name)(query_accounting.track_socket_event(name)(handler))
+        return socketio.on(name)(tracked)
+    return decorator
 
 # 主页路由
 @app.route('/')
@@ -68,10 +340,79 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+# 辅助函数：获取文件扩展名（小写）
+def file_ext(filename):
+    return filename.rsplit('.', 1)[1].lower()
+
+# 辅助函数：用户昵称或头像变更后递增资料版本号，并通知该用户所在频道的成员刷新缓存
+def broadcast_profile_update(user):
+    channel_ids = membership_cache.get_channel_ids(user.id)
+    # 缓存的消息中带有旧的资料版本
+    recent_messages.invalidate_channels(channel_ids)
+    if channel_ids:
+        socketio.emit('user_profile_updated', serialize_profile(user), to=[str(channel_id) for channel_id in channel_ids])
+
+# 辅助函数：准入检查，按当前用户和客户端IP限流；通过时返回None，被拒绝时返回建议的重试等待秒数
+def check_admission(event, user_id):
+    allowed, retry_after = admission.allow(event, user_id, request.remote_addr)
+    return None if allowed else retry_after
+
+# 辅助函数：检查消息内容是否为不超过长度限制的字符串（图片消息的说明文字可以为空）
+def valid_message_content(content, allow_empty=False):
+    return isinstance(content, str) and (allow_empty or content != '') and len(content) <= MESSAGE_MAX_LENGTH
+
+# 辅助函数：把ID、偏移量等查询参数限制在数据库整数范围内（可用作request.args.get的type）
+def db_int(value):
+    return max(0, min(int(value), DB_INT_MAX))
+
+# 辅助函数：保存上传文件之后处理失败时，回滚事务并释放本次保存增加的引用
+def release_failed_upload(path):
+    if path is None:
+        return
+    try:
+        db.session.rollback()
+        blob_store.release(path)
+    except Exception:
+        logger.exception('upload_release_failed', path=path)
+
+# 辅助函数：被限流时的HTTP响应
+def rate_limited_response(retry_after):
+    response = jsonify({'status': 'error', 'message': '操作过于频繁，请稍后再试'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+# 辅助函数：在当前事务中调整频道成员数量
+def adjust_member_count(channel_id, delta):
+    Channel.query.filter_by(id=channel_id).update(
+        {Channel.member_count: Channel.member_count + delta},
+        synchronize_session=False
+    )
+
 # API路由 - 健康检查
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'ok', 'message': 'CAN-Chat API is running'})
+    return jsonify({
+        'status': 'ok',
+        'message': 'CAN-Chat API is running',
+        # 准入控制的通过和拒绝计数
+        'admission': admission.stats()
+    })
+
+# 辅助函数：能否访问运行指标（包含各频道的在线人数，不对外公开）
+# 配置了METRICS_TOKEN时校验令牌；否则只允许本机的直接请求，经反向代理转发的请求（带X-Forwarded-For）不算本机
+def metrics_access_allowed():
+    token = app.config['METRICS_TOKEN']
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    return request.remote_addr in ('127.0.0.1', '::1') and 'X-Forwarded-For' not in request.headers
+
+# API路由 - 运行指标（Prometheus文本格式）
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    if not metrics_access_allowed():
+        return jsonify({'status': 'error', 'message': '无权访问运行指标'}), 403
+    return metrics.registry.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
 # API路由 - 上传头像
 @app.route('/api/upload/avatar', methods=['POST'])
@@ -80,6 +421,10 @@ def upload_avatar():
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
+    retry_after = check_admission('upload_avatar', user_id)
+    if retry_after is not None:
+        return rate_limited_response(retry_after)
+    
     # 检查是否有文件上传
     if 'avatar' not in request.files:
         return jsonify({'status': 'error', 'message': '未选择文件'}), 400
@@ -94,31 +439,39 @@ def upload_avatar():
     if not allowed_file(file.filename):
         return jsonify({'status': 'error', 'message': '只允许上传PNG、JPG、JPEG和GIF格式的图片'}), 400
     
+    # 已保存但尚未设为头像的文件（处理失败时释放其引用）
+    unused_path = None
     try:
-        # 生成唯一的文件名
-        filename = secure_filename(file.filename)
-        unique_filename = f"{uuid.uuid4().hex}_{filename}"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-        
-        # 保存文件
-        file.save(file_path)
-        
-        # 更新用户头像
         user = User.query.get(user_id)
         if not user:
             return jsonify({'status': 'error', 'message': '用户不存在'}), 404
         
-        # 更新头像路径（保存完整的相对路径，确保前端可以正确访问）
-        user.avatar = f"static/img/avatars/{unique_filename}"
+        # 按内容哈希保存文件，相同图片只保存一份
+        avatar_path = unused_path = blob_store.save(file, file_ext(file.filename))
+        metrics.upload_bytes.inc('avatar', amount=request.content_length or 0)
+        
+        # 更新头像路径（保存完整的相对路径，确保前端可以正确访问），释放旧头像的引用
+        old_avatar = user.avatar
+        user.avatar = avatar_path
+        if old_avatar != avatar_path:
+            user.profile_version += 1
         db.session.commit()
+        unused_path = None
+        if old_avatar != avatar_path:
+            blob_store.release(old_avatar)
+            broadcast_profile_update(user)
+        else:
+            # 重新上传当前头像时，用户仍只持有一个引用，释放本次保存增加的引用
+            blob_store.release(avatar_path)
         
         return jsonify({
             'status': 'success', 
             'message': '头像上传成功', 
             'avatar': user.avatar
         })
-    except Exception as e:
-        print(f"上传头像失败: {e}")
+    except Exception:
+        logger.exception('avatar_upload_failed', user_id=user_id)
+        release_failed_upload(unused_path)
         return jsonify({'status': 'error', 'message': '上传失败，请稍后重试'}), 500
 
 # API路由 - 发送邮箱验证码
@@ -152,12 +505,13 @@ def send_verification_code():
         
         db.session.commit()
         
-        # 发送验证码邮件
-        send_verify_email(email, code)
+        # 验证码邮件加入发件箱，由后台线程发送
+        if not email_outbox.send_verify_email(email, code):
+            return jsonify({'status': 'error', 'message': '发送验证码失败，请稍后重试'}), 503
         
         return jsonify({'status': 'success', 'message': '验证码已发送，有效期5分钟'})
-    except Exception as e:
-        print(f"发送验证码失败: {e}")
+    except Exception:
+        logger.exception('verification_code_failed', email=email)
         return jsonify({'status': 'error', 'message': '发送验证码失败，请稍后重试'}), 500
 
 # API路由 - 发送图片消息
@@ -167,17 +521,26 @@ def send_image_message():
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
+    retry_after = check_admission('send_image_message', user_id)
+    if retry_after is not None:
+        return rate_limited_response(retry_after)
+    
     # 检查是否有图片上传
     if 'image' not in request.files:
         return jsonify({'status': 'error', 'message': '未选择图片'}), 400
     
     image_file = request.files['image']
-    channel_id = request.form.get('channel_id')
+    channel_id = request.form.get('channel_id', type=db_int)
     content = request.form.get('content', '')
     
     if not channel_id:
         return jsonify({'status': 'error', 'message': '缺少频道ID'}), 400
     
+    if not valid_message_content(content, allow_empty=True):
+        return jsonify({'status': 'error', 'message': f'消息内容不能超过{MESSAGE_MAX_LENGTH}个字符'}), 400
+    
+    # 已保存但尚未写入消息的图片（处理失败时释放其引用）
+    unused_path = None
     try:
         # 检查频道是否存在
         channel = Channel.query.get(channel_id)
@@ -185,10 +548,14 @@ def send_image_message():
             return jsonify({'status': 'error', 'message': '频道不存在'}), 404
         
         # 检查用户是否已加入频道
-        existing = UserChannel.query.filter_by(user_id=user_id, channel_id=channel_id).first()
-        if not existing:
+        if not membership_cache.is_member(user_id, channel_id):
             return jsonify({'status': 'error', 'message': '未加入该频道'}), 403
         
+        # 获取发送者信息
+        sender = get_sender(user_id)
+        if not sender:
+            return jsonify({'status': 'error', 'message': '用户不存在'}), 404
+        
         # 保存图片
         if image_file.filename == '':
             return jsonify({'status': 'error', 'message': '未选择图片'}), 400
@@ -196,49 +563,42 @@ def send_image_message():
         if not allowed_file(image_file.filename):
             return jsonify({'status': 'error', 'message': '只允许上传PNG、JPG、JPEG和GIF格式的图片'}), 400
         
-        # 生成唯一的文件名
-        filename = secure_filename(image_file.filename)
-        unique_filename = f"{uuid.uuid4().hex}_{filename}"
-        # 保存到消息图片目录
-        message_image_folder = os.path.join(app.config['UPLOAD_FOLDER'], 'messages')
-        os.makedirs(message_image_folder, exist_ok=True)
-        file_path = os.path.join(message_image_folder, unique_filename)
-        image_file.save(file_path)
+        # 按内容哈希保存图片，相同图片只保存一份
+        image_path = unused_path = blob_store.save(image_file, file_ext(image_file.filename))
+        metrics.upload_bytes.inc('image', amount=request.content_length or 0)
         
         # 保存消息到数据库
-        message = Message(
-            content=content,
-            image=f"static/img/avatars/messages/{unique_filename}",
-            sender_id=user_id,
-            channel_id=channel_id
-        )
-        db.session.add(message)
-        db.session.commit()
+        try:
+            message = message_writer.write(
+                content=content,
+                image=image_path,
+                sender_id=user_id,
+                channel_id=channel_id
+            )
+        except WriteQueueFull:
+            release_failed_upload(unused_path)
+            return jsonify({'status': 'error', 'message': '服务器繁忙，请稍后重试'}), 503
+        unused_path = None
         
-        # 获取用户信息
-        user = User.query.get(user_id)
-        if not user:
-            return jsonify({'status': 'error', 'message': '用户不存在'}), 404
+        # 先加入最近消息缓存再广播
+        message_data = build_message_payload(message, sender)
+        recent_messages.append(message_data, serialize_profile(sender))
         
-        # 构建消息数据
-        message_data = {
-            'id': message.id,
-            'type': 'message',
-            'content': message.content,
-            'image': message.image,
-            'sender_id': message.sender_id,
-            'sender_nickname': user.nickname,
-            'sender_avatar': user.avatar,
-            'channel_id': message.channel_id,
-            'created_at': message.created_at.isoformat()
-        }
+        # 提交缩略图生成任务，完成后广播message_media_ready事件
+        message_data['media_pending'] = media_pipeline.submit(
+            message.id, message.channel_id, blob_store.abspath(image_path), os.path.dirname(image_path)
+        )
         
         # 通过WebSocket广播消息
         socketio.emit('new_message', message_data, room=str(channel_id))
         
+        # 自己发送的消息视为已读
+        read_markers.mark(user_id, channel_id, message.id)
+        
         return jsonify({'status': 'success', 'message': '图片消息发送成功', 'message_data': message_data})
-    except Exception as e:
-        print(f"发送图片消息失败: {e}")
+    except Exception:
+        logger.exception('image_message_failed', user_id=user_id)
+        release_failed_upload(unused_path)
         return jsonify({'status': 'error', 'message': '发送图片消息失败，请稍后重试'}), 500
 
 # API路由 - 验证邮箱
@@ -354,9 +714,8 @@ def login():
     if not user or not user.check_password(password):
         return jsonify({'status': 'error', 'message': '用户名或密码错误'}), 401
     
-    # 更新最后登录时间
-    user.last_login = datetime.utcnow()
-    db.session.commit()
+    # 记录最后登录时间（由后台线程批量写入数据库）
+    last_login = last_seen.touch(user.id)
     
     # 设置会话
     session['user_id'] = user.id
@@ -369,7 +728,7 @@ def login():
         'avatar': user.avatar,
         'bio': user.bio,
         'created_at': user.created_at.isoformat(),
-        'last_login': user.last_login.isoformat()
+        'last_login': last_login.isoformat()
     }})
 
 # API路由 - 用户登出
@@ -396,9 +755,28 @@ def get_current_user():
         'avatar': user.avatar,
         'bio': user.bio,
         'created_at': user.created_at.isoformat(),
-        'last_login': user.last_login.isoformat()
+        'last_login': last_seen.get(user.id, user.last_login).isoformat()
     }})
 
+# API路由 - 批量获取用户公开资料（/api/users?ids=1,2,3），客户端用于补全缓存中缺少的消息发送者
+@app.route('/api/users', methods=['GET'])
+def get_users():
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'status': 'error', 'message': '未登录'}), 401
+    
+    try:
+        ids = {db_int(value) for value in request.args.get('ids', '').split(',') if value.strip()}
+    except ValueError:
+        return jsonify({'status': 'error', 'message': '用户ID格式错误'}), 400
+    if not ids:
+        return jsonify({'status': 'error', 'message': '缺少用户ID'}), 400
+    if len(ids) > USER_PROFILE_BATCH_MAX:
+        return jsonify({'status': 'error', 'message': f'一次最多获取{USER_PROFILE_BATCH_MAX}个用户'}), 400
+    
+    users = db.session.query(User.id, User.nickname, User.avatar, User.profile_version).filter(User.id.in_(ids))
+    return jsonify({'status': 'success', 'users': {user.id: serialize_profile(user) for user in users}})
+
 # API路由 - 检查登录状态
 @app.route('/api/check_login', methods=['GET'])
 def check_login():
@@ -442,89 +820,65 @@ def create_channel():
         name=name,
         description=description,
         is_private=is_private,
-        created_by=user_id
+        created_by=user_id,
+        member_count=1
     )
     db.session.add(channel)
     
-    # 先提交频道对象，生成ID
-    db.session.commit()
+    # 先刷新频道对象，生成ID
+    db.session.flush()
     
-    # 创建者自动加入频道
+    # 创建者自动加入频道（与频道创建在同一事务中提交）
     user_channel = UserChannel(user_id=user_id, channel_id=channel.id)
     db.session.add(user_channel)
     
     db.session.commit()
+    membership_cache.invalidate(user_id)
+    channel_search_cache.clear()
+    
+    channel_data = serialize_channel(channel)
     
     # 发送系统通知（通过WebSocket广播给所有连接的客户端）
-    socketio.emit('channel_created', {
-        'channel': {
-            'id': channel.id,
-            'name': channel.name,
-            'description': channel.description,
-            'is_private': channel.is_private,
-            'created_by': channel.created_by,
-            'created_at': channel.created_at.isoformat(),
-            'user_count': 1
-        }
-    })
+    socketio.emit('channel_created', {'channel': channel_data})
     
-    return jsonify({'status': 'success', 'message': '频道创建成功', 'channel': {
-        'id': channel.id,
-        'name': channel.name,
-        'description': channel.description,
-        'is_private': channel.is_private,
-        'created_by': channel.created_by,
-        'created_at': channel.created_at.isoformat(),
-        'user_count': 1
-    }})
+    return jsonify({'status': 'success', 'message': '频道创建成功', 'channel': channel_data})
 
 # API路由 - 获取公开频道列表
 @app.route('/api/channels/public', methods=['GET'])
 def get_public_channels():
     channels = Channel.query.filter_by(is_private=False).order_by(Channel.created_at.desc()).all()
     
-    channel_list = []
-    for channel in channels:
-        # 获取频道用户数量
-        user_count = UserChannel.query.filter_by(channel_id=channel.id).count()
-        channel_list.append({
-            'id': channel.id,
-            'name': channel.name,
-            'description': channel.description,
-            'is_private': channel.is_private,
-            'created_by': channel.created_by,
-            'created_at': channel.created_at.isoformat(),
-            'user_count': user_count
-        })
+    channel_list = [serialize_channel(channel) for channel in channels]
     
     return jsonify({'status': 'success', 'channels': channel_list})
 
 # API路由 - 搜索频道
 @app.route('/api/channels/search', methods=['GET'])
 def search_channels():
-    keyword = request.args.get('q', '')
+    keyword = ' '.join(search_terms(request.args.get('q', '')))
     if not keyword:
         return jsonify({'status': 'error', 'message': '搜索关键词不能为空'}), 400
     
-    channels = Channel.query.filter(
-        Channel.is_private == False,
-        Channel.name.like(f'%{keyword}%') | Channel.description.like(f'%{keyword}%')
-    ).order_by(Channel.created_at.desc()).all()
+    limit = request.args.get('limit', SEARCH_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, SEARCH_PAGE_SIZE_MAX))
+    offset = request.args.get('offset', 0, type=db_int)
     
-    channel_list = []
-    for channel in channels:
-        user_count = UserChannel.query.filter_by(channel_id=channel.id).count()
-        channel_list.append({
-            'id': channel.id,
-            'name': channel.name,
-            'description': channel.description,
-            'is_private': channel.is_private,
-            'created_by': channel.created_by,
-            'created_at': channel.created_at.isoformat(),
-            'user_count': user_count
-        })
+    # 搜索即输入时同一前缀会被反复请求，短时间内直接返回缓存结果
+    cache_key = (keyword.lower(), limit, offset)
+    result = channel_search_cache.get(cache_key)
+    if result is None:
+        channels, has_more = search_public_channels(
+            keyword, limit, offset, use_index=app.config['CHANNEL_SEARCH_INDEXED']
+        )
+        result = {
+            'status': 'success',
+            'channels': [serialize_channel(channel) for channel in channels],
+            'has_more': has_more,
+            'next_offset': offset + len(channels) if has_more else None
+        }
+        channel_search_cache.set(cache_key, result)
     
-    return jsonify({'status': 'success', 'channels': channel_list})
+    return jsonify(result)
 
 # API路由 - 加入频道
 @app.route('/api/channels/<int:channel_id>/join', methods=['POST'])
@@ -543,10 +897,12 @@ def join_channel(channel_id):
     if existing:
         return jsonify({'status': 'error', 'message': '已经加入该频道'}), 400
     
-    # 加入频道
-    user_channel = UserChannel(user_id=user_id, channel_id=channel_id)
+    # 加入频道（加入前的历史消息不计为未读）
+    user_channel = UserChannel(user_id=user_id, channel_id=channel_id, last_read_message_id=latest_message_id(channel_id))
     db.session.add(user_channel)
+    adjust_member_count(channel_id, 1)
     db.session.commit()
+    membership_cache.invalidate(user_id)
     
     return jsonify({'status': 'success', 'message': '成功加入频道'})
 
@@ -573,7 +929,9 @@ def leave_channel(channel_id):
     
     # 退出频道
     db.session.delete(existing)
+    adjust_member_count(channel_id, -1)
     db.session.commit()
+    membership_cache.invalidate(user_id)
     
     return jsonify({'status': 'success', 'message': '成功退出频道'})
 
@@ -584,23 +942,14 @@ def get_joined_channels():
     if not user_id:
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
-    # 获取用户加入的频道
-    user_channels = UserChannel.query.filter_by(user_id=user_id).all()
-    channel_ids = [uc.channel_id for uc in user_channels]
-    channels = Channel.query.filter(Channel.id.in_(channel_ids)).order_by(Channel.created_at.desc()).all()
-    
+    # 先写入该用户尚未保存的已读位置，再一次查询出频道及未读数量
+    read_markers.flush(user_id=user_id)
     channel_list = []
-    for channel in channels:
-        user_count = UserChannel.query.filter_by(channel_id=channel.id).count()
-        channel_list.append({
-            'id': channel.id,
-            'name': channel.name,
-            'description': channel.description,
-            'is_private': channel.is_private,
-            'created_by': channel.created_by,
-            'created_at': channel.created_at.isoformat(),
-            'user_count': user_count
-        })
+    for channel, last_read_message_id, unread_count in joined_channels_with_unread(user_id):
+        channel_data = serialize_channel(channel)
+        channel_data['last_read_message_id'] = last_read_message_id
+        channel_data['unread_count'] = unread_count
+        channel_list.append(channel_data)
     
     return jsonify({'status': 'success', 'channels': channel_list})
 
@@ -611,26 +960,16 @@ def get_channel_detail(channel_id):
     if not channel:
         return jsonify({'status': 'error', 'message': '频道不存在'}), 404
     
-    # 获取频道用户数量
-    user_count = UserChannel.query.filter_by(channel_id=channel.id).count()
-    
     # 检查当前用户是否已加入频道
     is_joined = False
     user_id = session.get('user_id')
     if user_id:
-        existing = UserChannel.query.filter_by(user_id=user_id, channel_id=channel_id).first()
-        is_joined = existing is not None
-    
-    return jsonify({'status': 'success', 'channel': {
-        'id': channel.id,
-        'name': channel.name,
-        'description': channel.description,
-        'is_private': channel.is_private,
-        'created_by': channel.created_by,
-        'created_at': channel.created_at.isoformat(),
-        'user_count': user_count,
-        'is_joined': is_joined
-    }})
+        is_joined = membership_cache.is_member(user_id, channel_id)
+    
+    channel_data = serialize_channel(channel)
+    channel_data['is_joined'] = is_joined
+    
+    return jsonify({'status': 'success', 'channel': channel_data})
 
 # API路由 - 获取频道消息历史
 @app.route('/api/channels/<int:channel_id>/messages', methods=['GET'])
@@ -640,53 +979,134 @@ def get_channel_messages(channel_id):
         return jsonify({'status': 'error', 'message': '未登录'}), 401
     
     # 检查用户是否已加入频道
-    existing = UserChannel.query.filter_by(user_id=user_id, channel_id=channel_id).first()
-    if not existing:
+    if not membership_cache.is_member(user_id, channel_id):
         return jsonify({'status': 'error', 'message': '未加入该频道'}), 403
     
-    # 获取频道消息，按时间排序
-    messages = Message.query.filter_by(channel_id=channel_id).order_by(Message.created_at.asc()).all()
-    
-    message_list = []
-    for msg in messages:
-        message_list.append({
-            'id': msg.id,
-            'content': msg.content,
-            'image': msg.image,
-            'sender_id': msg.sender_id,
-            'sender_nickname': msg.sender.nickname,
-            'sender_avatar': msg.sender.avatar,
-            'channel_id': msg.channel_id,
-            'created_at': msg.created_at.isoformat()
-        })
+    # 分页参数：before_id 向前翻页，after_id 向后追赶，默认返回最新一页
+    before_id = request.args.get('before_id', type=db_int)
+    after_id = request.args.get('after_id', type=db_int)
+    limit = request.args.get('limit', MESSAGE_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MESSAGE_PAGE_SIZE_MAX))
+    
+    if before_id is not None and after_id is not None:
+        return jsonify({'status': 'error', 'message': 'before_id和after_id不能同时使用'}), 400
+    
+    if before_id is None and after_id is None:
+        # 最新一页优先从最近消息缓存中读取
+        message_list, users, has_more = recent_messages.latest_page(channel_id, limit)
+    else:
+        # 基于 (channel_id, id) 索引的keyset分页，多取一条用于判断是否还有更多
+        query = message_query().filter(Message.channel_id == channel_id)
+        if after_id is not None:
+            messages = query.filter(Message.id > after_id).order_by(Message.id.asc()).limit(limit + 1).all()
+            has_more = len(messages) > limit
+            messages = messages[:limit]
+        else:
+            messages = query.filter(Message.id < before_id).order_by(Message.id.desc()).limit(limit + 1).all()
+            has_more = len(messages) > limit
+            # 按时间正序返回
+            messages = messages[:limit][::-1]
+        message_list = [serialize_message(msg) for msg in messages]
+        users = serialize_senders(messages)
+    
+    # 游标：before_id 用于加载更早的消息，after_id 用于加载更新的消息
+    cursor = {
+        'before_id': message_list[0]['id'] if message_list else before_id,
+        'after_id': message_list[-1]['id'] if message_list else after_id,
+        'has_more': has_more
+    }
+    
+    return jsonify({
+        'status': 'success',
+        'messages': message_list,
+        'users': users,
+        'cursor': cursor
+    })
+
+# API路由 - 标记频道消息已读（{"message_id": 已读到的消息ID}，延迟批量写入）
+@app.route('/api/channels/<int:channel_id>/read', methods=['POST'])
+def mark_channel_read(channel_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'status': 'error', 'message': '未登录'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    message_id = data.get('message_id')
+    if not isinstance(message_id, int) or message_id <= 0:
+        return jsonify({'status': 'error', 'message': '缺少有效的消息ID'}), 400
+    
+    # 检查用户是否已加入频道
+    if not membership_cache.is_member(user_id, channel_id):
+        return jsonify({'status': 'error', 'message': '未加入该频道'}), 403
+    
+    # 超出数据库整数范围的ID按上限记录，写入时再限制为频道内最新的消息ID
+    read_markers.mark(user_id, channel_id, min(message_id, DB_INT_MAX))
+    return jsonify({'status': 'success', 'message': '已标记为已读'})
+
+# API路由 - 获取频道在线用户（当前进程的连接）
+@app.route('/api/channels/<int:channel_id>/presence', methods=['GET'])
+def get_channel_presence(channel_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'status': 'error', 'message': '未登录'}), 401
     
-    return jsonify({'status': 'success', 'messages': message_list})
+    # 检查用户是否已加入频道
+    if not membership_cache.is_member(user_id, channel_id):
+        return jsonify({'status': 'error', 'message': '未加入该频道'}), 403
+    
+    online = presence.online_users(channel_id)
+    return jsonify({'status': 'success', 'channel_id': channel_id, 'online': online, 'count': len(online)})
+
+# API路由 - 搜索频道消息
+@app.route('/api/channels/<int:channel_id>/messages/search', methods=['GET'])
+def search_channel_messages(channel_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'status': 'error', 'message': '未登录'}), 401
+    
+    if not app.config['MESSAGE_SEARCH_ENABLED']:
+        return jsonify({'status': 'error', 'message': '消息搜索不可用'}), 503
+    
+    # 检查用户是否已加入频道
+    if not membership_cache.is_member(user_id, channel_id):
+        return jsonify({'status': 'error', 'message': '未加入该频道'}), 403
+    
+    keyword = ' '.join(search_terms(request.args.get('q', '')))
+    if not keyword:
+        return jsonify({'status': 'error', 'message': '搜索关键词不能为空'}), 400
+    
+    limit = request.args.get('limit', SEARCH_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, SEARCH_PAGE_SIZE_MAX))
+    offset = request.args.get('offset', 0, type=db_int)
+    
+    rows, has_more = search_messages(channel_id, keyword, limit, offset)
+    
+    return jsonify({
+        'status': 'success',
+        'messages': [serialize_message(row) for row in rows],
+        'users': serialize_senders(rows),
+        'has_more': has_more,
+        'next_offset': offset + len(rows) if has_more else None
+    })
 
 # WebSocket事件 - 连接建立
-@socketio.on('connect')
+@socket_event('connect')
 def handle_connect():
     user_id = session.get('user_id')
+    logger.info('socket_connected', user_id=user_id, sid=request.sid)
     if user_id:
-        print(f'用户 {user_id} 已连接')
-        # 更新用户最后登录时间
-        user = User.query.get(user_id)
-        if user:
-            user.last_login = datetime.utcnow()
-            db.session.commit()
-    else:
-        print('匿名用户已连接')
+        presence.connect(request.sid, user_id)
+        # 记录用户最后活跃时间（由后台线程批量写入数据库）
+        last_seen.touch(user_id)
 
 # WebSocket事件 - 连接断开
-@socketio.on('disconnect')
+@socket_event('disconnect')
 def handle_disconnect():
-    user_id = session.get('user_id')
-    if user_id:
-        print(f'用户 {user_id} 已断开连接')
-    else:
-        print('匿名用户已断开连接')
+    presence.disconnect(request.sid)
+    logger.info('socket_disconnected', user_id=session.get('user_id'), sid=request.sid)
 
 # WebSocket事件 - 加入频道
-@socketio.on('join_channel')
+@socket_event('join_channel')
 def handle_join_channel(data):
     user_id = session.get('user_id')
     if not user_id:
@@ -699,13 +1119,24 @@ def handle_join_channel(data):
         return
     
     # 检查用户是否已加入频道
-    existing = UserChannel.query.filter_by(user_id=user_id, channel_id=channel_id).first()
-    if not existing:
+    if not membership_cache.is_member(user_id, channel_id):
         emit('error', {'message': '未加入该频道'})
         return
     
     # 加入房间
     join_room(str(channel_id))
+    presence.join(request.sid, channel_id)
+    
+    # 补发last_seen_id之后的消息（加入房间之后查询，之后的新消息通过广播收到，不会遗漏）
+    last_seen_id = data.get('last_seen_id')
+    if isinstance(last_seen_id, int) and last_seen_id >= 0:
+        messages, users, has_more = recent_messages.replay(int(channel_id), db_int(last_seen_id), REPLAY_MAX_MESSAGES)
+        emit('channel_replay', {
+            'channel_id': int(channel_id),
+            'messages': messages,
+            'users': users,
+            'has_more': has_more
+        })
     
     # 获取用户信息
     user = User.query.get(user_id)
@@ -722,10 +1153,10 @@ def handle_join_channel(data):
     }
     emit('system_notification', system_message, room=str(channel_id))
     
-    print(f'用户 {user.nickname} 加入了频道 {channel_id}')
+    logger.info('channel_joined', user_id=user_id, channel_id=channel_id)
 
 # WebSocket事件 - 离开频道
-@socketio.on('leave_channel')
+@socket_event('leave_channel')
 def handle_leave_channel(data):
     user_id = session.get('user_id')
     if not user_id:
@@ -739,6 +1170,7 @@ def handle_leave_channel(data):
     
     # 离开房间
     leave_room(str(channel_id))
+    presence.leave(request.sid, channel_id)
     
     # 获取用户信息
     user = User.query.get(user_id)
@@ -755,16 +1187,21 @@ def handle_leave_channel(data):
     }
     emit('system_notification', system_message, room=str(channel_id))
     
-    print(f'用户 {user.nickname} 离开了频道 {channel_id}')
+    logger.info('channel_left', user_id=user_id, channel_id=channel_id)
 
 # WebSocket事件 - 发送消息
-@socketio.on('send_message')
+@socket_event('send_message')
 def handle_send_message(data):
     user_id = session.get('user_id')
     if not user_id:
         emit('error', {'message': '未登录'})
         return
     
+    retry_after = check_admission('send_message', user_id)
+    if retry_after is not None:
+        emit('error', {'message': '发送过于频繁，请稍后再试', 'retry_after': round(retry_after, 2)})
+        return
+    
     channel_id = data.get('channel_id')
     content = data.get('content')
     
@@ -772,45 +1209,68 @@ def handle_send_message(data):
         emit('error', {'message': '缺少频道ID或消息内容'})
         return
     
+    if not valid_message_content(content):
+        emit('error', {'message': f'消息内容必须是不超过{MESSAGE_MAX_LENGTH}个字符的文本'})
+        return
+    
     # 检查用户是否已加入频道
-    existing = UserChannel.query.filter_by(user_id=user_id, channel_id=channel_id).first()
-    if not existing:
+    if not membership_cache.is_member(user_id, channel_id):
         emit('error', {'message': '未加入该频道'})
         return
     
-    # 保存消息到数据库
-    message = Message(
-        content=content,
-        sender_id=user_id,
-        channel_id=channel_id
-    )
-    db.session.add(message)
-    db.session.commit()
-    
-    # 获取完整的消息数据
-    user = User.query.get(user_id)
-    if not user:
+    # 获取发送者信息
+    sender = get_sender(user_id)
+    if not sender:
         emit('error', {'message': '用户不存在'})
         return
     
-    message_data = {
-        'id': message.id,
-        'type': 'message',
-        'content': message.content,
-        'sender_id': message.sender_id,
-        'sender_nickname': user.nickname,
-        'sender_avatar': user.avatar,
-        'channel_id': message.channel_id,
-        'created_at': message.created_at.isoformat()
-    }
+    # 保存消息到数据库
+    try:
+        message = message_writer.write(
+            content=content,
+            sender_id=user_id,
+            channel_id=channel_id
+        )
+    except WriteQueueFull:
+        emit('error', {'message': '服务器繁忙，请稍后重试'})
+        return
+    
+    # 构建消息数据，先加入最近消息缓存再广播
+    message_data = build_message_payload(message, sender)
+    recent_messages.append(message_data, serialize_profile(sender))
     
     # 广播消息到频道
     emit('new_message', message_data, room=str(channel_id))
     
-    print(f'用户 {user.nickname} 在频道 {channel_id} 发送了消息: {content}')
+    # 自己发送的消息视为已读
+    read_markers.mark(user_id, channel_id, message.id)
+    
+    logger.debug('message_sent', user_id=user_id, channel_id=channel_id, message_id=message.id, content=content)
+
+# WebSocket事件 - 标记频道消息已读（延迟批量写入）
+@socket_event('mark_read')
+def handle_mark_read(data):
+    user_id = session.get('user_id')
+    if not user_id:
+        emit('error', {'message': '未登录'})
+        return
+    
+    channel_id = data.get('channel_id')
+    message_id = data.get('message_id')
+    if not isinstance(message_id, int) or message_id <= 0:
+        emit('error', {'message': '缺少有效的消息ID'})
+        return
+    
+    # 检查用户是否已加入频道
+    if not membership_cache.is_member(user_id, channel_id):
+        emit('error', {'message': '未加入该频道'})
+        return
+    
+    # 超出数据库整数范围的ID按上限记录，写入时再限制为频道内最新的消息ID
+    read_markers.mark(user_id, channel_id, min(message_id, DB_INT_MAX))
 
 # WebSocket事件 - 新频道创建通知
-@socketio.on('new_channel_created')
+@socket_event('new_channel_created')
 def handle_new_channel_created(data):
     # 这个事件主要用于前端通知，后端不需要额外处理
     pass
@@ -831,7 +1291,15 @@ def update_user_profile():
     if not user:
         return jsonify({'status': 'error', 'message': '用户不存在'}), 404
     
+    # 上传的头像只能通过上传接口更换（由上传接口维护引用次数），这里只能改为其他非上传的头像
+    old_avatar = user.avatar
+    if 'avatar' in data and not isinstance(data['avatar'], str):
+        return jsonify({'status': 'error', 'message': '头像路径格式错误'}), 400
+    if 'avatar' in data and data['avatar'] != old_avatar and blob_store.owns(data['avatar']):
+        return jsonify({'status': 'error', 'message': '请通过上传接口更换头像'}), 400
+    
     # 更新用户信息
+    profile = (user.nickname, user.avatar)
     if 'nickname' in data:
         user.nickname = data['nickname']
     if 'avatar' in data:
@@ -839,9 +1307,21 @@ def update_user_profile():
     if 'bio' in data:
         user.bio = data['bio']
     
+    # 昵称或头像变化时递增资料版本号
+    profile_changed = (user.nickname, user.avatar) != profile
+    if profile_changed:
+        user.profile_version += 1
+    
     # 保存到数据库
     db.session.commit()
     
+    # 不再使用的上传头像释放引用
+    if user.avatar != old_avatar:
+        blob_store.release(old_avatar)
+    
+    if profile_changed:
+        broadcast_profile_update(user)
+    
     return jsonify({'status': 'success', 'message': '个人信息更新成功', 'user': {
         'id': user.id,
         'username': user.username,
@@ -849,8 +1329,98 @@ def update_user_profile():
         'avatar': user.avatar,
         'bio': user.bio,
         'created_at': user.created_at.isoformat(),
-        'last_login': user.last_login.isoformat()
+        'last_login': last_seen.get(user.id, user.last_login).isoformat()
     }})
 
+# 命令行 - 重新统计频道成员数量（flask --app app repair-member-counts）
+@app.cli.command('repair-member-counts')
+def repair_member_counts():
+    actual = db.session.query(db.func.count(UserChannel.user_id)).filter(
+        UserChannel.channel_id == Channel.id
+    ).scalar_subquery()
+    result = db.session.execute(
+        db.update(Channel).where(Channel.member_count != actual).values(member_count=actual)
+    )
+    db.session.commit()
+    print(f'已修复 {result.rowcount} 个频道的成员数量')
+
+# 命令行 - 重建消息全文索引（flask --app app rebuild-message-index）
+@app.cli.command('rebuild-message-index')
+def rebuild_message_index():
+    if not ensure_search_index(db.engine):
+        print('当前数据库不支持FTS5全文索引')
+        return
+    rebuild_search_index(db.engine)
+    print('消息全文索引已重建')
+
+# 命令行 - 重建频道全文索引（flask --app app rebuild-channel-index）
+@app.cli.command('rebuild-channel-index')
+def rebuild_channel_index_command():
+    if not ensure_channel_index(db.engine):
+        print('当前数据库不支持FTS5全文索引')
+        return
+    rebuild_channel_index(db.engine)
+    print('频道全文索引已重建')
+
+# 命令行 - 将旧的上传文件迁移到去重存储（flask --app app dedupe-uploads）
+@app.cli.command('dedupe-uploads')
+def dedupe_uploads():
+    prefix = 'static/img/avatars/'
+    references = {}
+    for user in User.query.filter(User.avatar.startswith(prefix)).all():
+        references.setdefault(user.avatar, []).append(user)
+    for message in Message.query.filter(Message.image.startswith(prefix)).all():
+        references.setdefault(message.image, []).append(message)
+    
+    migrated = 0
+    for old_path, rows in references.items():
+        file_path = blob_store.abspath(old_path)
+        if not os.path.exists(file_path):
+            continue
+        new_path = blob_store.import_file(file_path, count=len(rows))
+        for row in rows:
+            if isinstance(row, User):
+                row.avatar = new_path
+            else:
+                row.image = new_path
+        db.session.commit()
+        migrated += 1
+    print(f'已迁移 {migrated} 个文件，共 {sum(len(rows) for rows in references.values())} 处引用')
+
+# 命令行 - 删除不再被引用的上传文件（flask --app app gc-uploads）
+@app.cli.command('gc-uploads')
+def gc_uploads():
+    print(f'已删除 {blob_store.gc()} 个不再被引用的文件')
+
+# 命令行 - 生成静态文件的gzip/brotli预压缩版本（flask --app app compress-static），部署前执行
+@app.cli.command('compress-static')
+def compress_static_command():
+    print(f'已生成 {compress_static(app.static_folder)} 个预压缩文件')
+
+# 命令行 - 生成测试数据集（flask --app app generate-data --users 10000 --channels 500 --messages 1000000）
+# 追加到当前数据库中，生成的用户密码均为 password
+@app.cli.command('generate-data')
+@click.option('--users', default=1000, show_default=True, help='用户数量')
+@click.option('--channels', default=100, show_default=True, help='频道数量')
+@click.option('--messages', default=100000, show_default=True, help='消息数量')
+@click.option('--memberships', default=5, show_default=True, help='每个用户平均加入的频道数')
+@click.option('--popularity-exponent', default=1.0, show_default=True, help='频道成员数的幂律指数')
+@click.option('--activity-exponent', default=1.2, show_default=True, help='频道消息数的幂律指数')
+@click.option('--days', default=30, show_default=True, help='消息时间分布的天数')
+@click.option('--seed', type=int, default=None, help='随机数种子')
+def generate_data(users, channels, messages, memberships, popularity_exponent, activity_exponent, days, seed):
+    if users < 1 or channels < 1 or messages < 0:
+        raise click.BadParameter('用户数和频道数至少为1，消息数不能为负数')
+    result = generate_dataset(
+        users, channels, messages,
+        memberships=memberships,
+        popularity_exponent=popularity_exponent,
+        activity_exponent=activity_exponent,
+        days=days,
+        seed=seed
+    )
+    print(f"已生成 {result['users']} 个用户、{result['channels']} 个频道、{result['memberships']} 条成员关系、"
+          f"{result['messages']} 条消息，耗时 {result['seconds']} 秒")
+
 if __name__ == '__main__':
     socketio.run(app, host='0.0.0.0', port=3080, debug=True)
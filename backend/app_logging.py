@@ -0,0 +1,159 @@
+from datetime import datetime, timezone
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+
+# 记录时替换为长度说明的字段（消息内容、密码、邮箱、验证码等），原文不会进入日志队列
+REDACTED_FIELDS = frozenset(('content', 'password', 'email', 'code'))
+
+# 按事件名配置的日志级别和采样率，由configure_logging设置，所有EventLogger共享
+_event_levels = {}
+_sample_rates = {}
+
+# 隐去敏感字段的值，只保留长度
+def redact(value):
+    if value is None:
+        return None
+    return f'[已隐去 {len(str(value))} 字符]'
+
+# 解析 "name=value,name=value" 格式的配置
+def parse_mapping(text, convert=str):
+    mapping = {}
+    for item in (text or '').split(','):
+        if '=' in item:
+            name, value = item.split('=', 1)
+            mapping[name.strip()] = convert(value.strip())
+    return mapping
+
+# 日志级别名称或数值转换为数值
+def level_value(level):
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).upper())
+    if not isinstance(value, int):
+        raise ValueError(f'未知的日志级别: {level}')
+    return value
+
+# 结构化日志：每个事件一条记录，字段放在record.fields中，由格式化器输出
+# 事件的级别可由配置覆盖；配置了采样率的高频事件按比例随机记录，记录中带有sample_rate
+class EventLogger:
+    def __init__(self, name):
+        self.logger = logging.getLogger(name)
+
+    def event(self, name, level=logging.INFO, exc_info=False, **fields):
+        level = _event_levels.get(name, level)
+        if not self.logger.isEnabledFor(level):
+            return
+        rate = _sample_rates.get(name)
+        if rate is not None:
+            if random.random() >= rate:
+                return
+            fields['sample_rate'] = rate
+        for key in REDACTED_FIELDS.intersection(fields):
+            fields[key] = redact(fields[key])
+        self.logger.log(level, name, exc_info=exc_info, extra={'event': name, 'fields': fields})
+
+    def debug(self, name, **fields):
+        self.event(name, logging.DEBUG, **fields)
+
+    def info(self, name, **fields):
+        self.event(name, logging.INFO, **fields)
+
+    def warning(self, name, **fields):
+        self.event(name, logging.WARNING, **fields)
+
+    def error(self, name, **fields):
+        self.event(name, logging.ERROR, **fields)
+
+    # 记录异常及堆栈（需在except块中调用）
+    def exception(self, name, **fields):
+        self.event(name, logging.ERROR, exc_info=True, **fields)
+
+def get_logger(name):
+    return EventLogger(name)
+
+# 异常的简短描述（用于error字段）：只包含异常类型，数据库异常附带驱动的错误信息，
+# 不使用str(e)，SQLAlchemy异常的字符串中包含语句参数（如消息内容）
+def describe_error(error):
+    orig = getattr(error, 'orig', None)
+    if orig is not None:
+        return f'{type(error).__name__}: {orig}'
+    return type(error).__name__
+
+# 每条记录输出为一行JSON
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': getattr(record, 'event', None),
+        }
+        if entry['event'] is None:
+            entry['message'] = record.getMessage()
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+# 开发时使用的单行文本格式：时间 级别 日志名 事件 字段=值
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = ' '.join(f'{key}={value}' for key, value in getattr(record, 'fields', {}).items())
+        text = f"{self.formatTime(record)} {record.levelname} {record.name} {record.getMessage()} {fields}".rstrip()
+        if record.exc_text:
+            text += '\n' + record.exc_text
+        return text
+
+# 日志队列：调用方只把记录放入有界队列，由后台线程格式化并写出，队列已满时丢弃并计数
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    # 在调用方线程中只处理异常堆栈和消息参数，其他字段原样交给后台线程格式化
+    def prepare(self, record):
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+# 后台写出线程，stop可重复调用（退出时和测试中都可能停止）
+class LogListener(logging.handlers.QueueListener):
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+
+# 配置根日志：记录经队列由后台线程写到标准输出
+# level为全局级别，event_levels/sample_rates为按事件名的级别和采样率，log_format为json或text
+# 返回队列处理器和后台监听器（进程退出前需调用listener.stop()写出剩余记录）
+def configure_logging(level='INFO', event_levels=None, sample_rates=None, log_format='json', queue_size=10000):
+    _event_levels.clear()
+    _event_levels.update({name: level_value(value) for name, value in (event_levels or {}).items()})
+    _sample_rates.clear()
+    _sample_rates.update({name: min(1.0, max(0.0, float(rate))) for name, rate in (sample_rates or {}).items()})
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter() if log_format == 'json' else TextFormatter())
+    handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+    listener = LogListener(handler.queue, stream)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        if isinstance(existing, DroppingQueueHandler):
+            root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level_value(level))
+    listener.start()
+    return handler, listener
@@ -0,0 +1,134 @@
+from collections import OrderedDict
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+
+from app_logging import describe_error, get_logger
+from models import db, Channel
+from message_search import build_match_query, search_terms, MIN_TERM_LENGTH
+
+logger = get_logger(__name__)
+
+# 频道全文索引：对频道名称和描述建立trigram索引，由触发器随channels表同步更新
+SEARCH_SCHEMA_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS channels_fts USING fts5("
+    "name, description, content='channels', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS channels_fts_ai AFTER INSERT ON channels BEGIN "
+    "INSERT INTO channels_fts(rowid, name, description) VALUES (new.id, new.name, new.description); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS channels_fts_ad AFTER DELETE ON channels BEGIN "
+    "INSERT INTO channels_fts(channels_fts, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS channels_fts_au AFTER UPDATE OF name, description ON channels BEGIN "
+    "INSERT INTO channels_fts(channels_fts, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); "
+    "INSERT INTO channels_fts(rowid, name, description) VALUES (new.id, new.name, new.description); "
+    "END",
+)
+
+REBUILD_SQL = "INSERT INTO channels_fts(channels_fts) VALUES ('rebuild')"
+
+# 短于 MIN_TERM_LENGTH 的词（或索引不可用时）改用LIKE扫描最近创建的 SHORT_TERM_SCAN_LIMIT 个公开频道
+SHORT_TERM_SCAN_LIMIT = 10000
+
+# 名称匹配的权重高于描述
+SEARCH_SQL = db.text(
+    "SELECT channels.id FROM channels_fts "
+    "JOIN channels ON channels.id = channels_fts.rowid "
+    "WHERE channels_fts MATCH :query AND channels.is_private = 0 "
+    "ORDER BY bm25(channels_fts, 10.0, 1.0), channels.created_at DESC "
+    "LIMIT :limit OFFSET :offset"
+)
+
+# 创建频道全文索引及同步触发器（已存在时跳过），新建时回填已有频道
+# 返回False表示当前SQLite不支持FTS5
+def ensure_channel_index(engine):
+    if engine.dialect.name != 'sqlite':
+        return False
+    with engine.begin() as conn:
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'channels_fts'"
+        ).first()
+        try:
+            for sql in SEARCH_SCHEMA_SQL:
+                conn.exec_driver_sql(sql)
+        except OperationalError as e:
+            logger.warning('channel_search_unavailable', error=describe_error(e))
+            return False
+        if not exists:
+            conn.exec_driver_sql(REBUILD_SQL)
+    return True
+
+# 根据channels表重建频道全文索引
+def rebuild_channel_index(engine):
+    with engine.begin() as conn:
+        conn.exec_driver_sql(REBUILD_SQL)
+
+# 搜索公开频道，返回 (频道列表, 是否还有更多)
+# 所有词都足够长且索引可用时使用全文索引按相关度排序，否则在最近创建的频道中使用LIKE按创建时间倒序
+def search_public_channels(keyword, limit, offset, use_index=True):
+    terms = search_terms(keyword)
+    if not terms:
+        return [], False
+    if use_index and all(len(term) >= MIN_TERM_LENGTH for term in terms):
+        ids = [row.id for row in db.session.execute(SEARCH_SQL, {
+            'query': build_match_query(terms),
+            'limit': limit + 1,
+            'offset': offset
+        })]
+        has_more = len(ids) > limit
+        ids = ids[:limit]
+        if not ids:
+            return [], False
+        channels = {channel.id: channel for channel in Channel.query.filter(Channel.id.in_(ids))}
+        return [channels[channel_id] for channel_id in ids if channel_id in channels], has_more
+
+    query = Channel.query.filter(Channel.is_private == False)
+    # 频道ID随创建顺序递增，按主键找到扫描范围的下界，限制LIKE扫描的行数
+    lower_id = db.session.query(Channel.id).filter(Channel.is_private == False).order_by(
+        Channel.id.desc()
+    ).offset(SHORT_TERM_SCAN_LIMIT - 1).limit(1).scalar()
+    if lower_id is not None:
+        query = query.filter(Channel.id >= lower_id)
+    for term in terms:
+        query = query.filter(
+            Channel.name.contains(term, autoescape=True) | Channel.description.contains(term, autoescape=True)
+        )
+    channels = query.order_by(Channel.created_at.desc()).limit(limit + 1).offset(offset).all()
+    return channels[:limit], len(channels) > limit
+
+# 短时间缓存热门搜索结果：key -> (过期时间, 结果)，按LRU淘汰
+class SearchCache:
+    def __init__(self, ttl=10, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # 获取未过期的缓存结果，不存在时返回None
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    # 写入缓存结果
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # 清空缓存
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,161 @@
+from bisect import bisect
+from datetime import datetime, timedelta
+from itertools import accumulate
+import random
+import time
+
+from models import db, User, Channel, UserChannel, Message
+from message_search import ensure_search_index, rebuild_search_index
+
+# 每批插入的行数
+INSERT_CHUNK_SIZE = 20000
+
+# 预先生成的不同消息内容数量，生成消息时从中随机选取
+CONTENT_POOL_SIZE = 10000
+
+# 生成数据的统一密码
+PASSWORD = 'password'
+
+# 消息内容使用的词汇（中英文混合，便于测试全文搜索）
+WORDS = (
+    '你好', '大家好', '今天', '明天', '晚上', '开会', '项目', '进度', '周报', '上线', '测试', '部署',
+    '数据库', '服务器', '接口', '文档', '设计', '需求', '问题', '修复', '谢谢', '收到', '好的', '没问题',
+    '午饭', '咖啡', '周末', '电影', '音乐', '游戏', '照片', '旅行', '天气', '下雨', '加班', '放假',
+    'hello', 'thanks', 'deploy', 'release', 'review', 'merge', 'bug', 'fix', 'meeting', 'lunch',
+    'python', 'flask', 'sqlite', 'socket', 'latency', 'cache', 'index', 'query', 'benchmark', 'docs',
+)
+
+CHANNEL_TOPICS = (
+    '技术', '闲聊', '游戏', '音乐', '电影', '读书', '旅行', '摄影', '美食', '运动',
+    'python', 'frontend', 'backend', 'devops', 'design', 'random', 'news', 'help',
+)
+
+# 按幂律分布的权重：第rank名的权重为 1 / rank^exponent
+def power_law_weights(count, exponent):
+    return [1 / (rank + 1) ** exponent for rank in range(count)]
+
+# 按累积权重随机抽取下标
+def weighted_index(rng, cumulative):
+    return bisect(cumulative, rng.random() * cumulative[-1])
+
+# 分批插入（直接使用表的INSERT语句executemany，跳过ORM的逐行处理）
+def insert_chunks(model, rows):
+    statement = model.__table__.insert()
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= INSERT_CHUNK_SIZE:
+            db.session.execute(statement, chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(statement, chunk)
+
+# 生成测试数据集（需在应用上下文中调用），追加到已有数据之后：
+# - users个用户，每人平均加入memberships个频道，频道受欢迎程度按幂律分布（少数频道成员很多）
+# - channels个频道，其中private_ratio比例为私有频道
+# - messages条消息，频道活跃度按幂律分布（activity_exponent越大越集中），发送者为频道成员，时间分布在最近days天内
+# 返回各表插入的行数和耗时
+def generate_dataset(users, channels, messages, memberships=5, popularity_exponent=1.0,
+                     activity_exponent=1.2, private_ratio=0.1, days=30, seed=None):
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    begin = now - timedelta(days=days)
+
+    user_base = db.session.query(db.func.coalesce(db.func.max(User.id), 0)).scalar()
+    channel_base = db.session.query(db.func.coalesce(db.func.max(Channel.id), 0)).scalar()
+    message_base = db.session.query(db.func.coalesce(db.func.max(Message.id), 0)).scalar()
+
+    # 密码哈希计算较慢，所有用户共用同一个哈希
+    template = User()
+    template.set_password(PASSWORD)
+
+    user_ids = range(user_base + 1, user_base + users + 1)
+    insert_chunks(User, ({
+        'id': user_id,
+        'username': f'user{user_id}',
+        'email': f'user{user_id}@example.com',
+        'email_verified': True,
+        'password_hash': template.password_hash,
+        'nickname': f'{rng.choice(CHANNEL_TOPICS)}爱好者{user_id}',
+        'created_at': begin + timedelta(seconds=rng.random() * days * 86400),
+        'last_login': begin + timedelta(seconds=rng.random() * days * 86400)
+    } for user_id in user_ids))
+
+    # 成员关系：每个用户按受欢迎程度加入约memberships个不同的频道，频道创建者一定是成员
+    channel_ids = list(range(channel_base + 1, channel_base + channels + 1))
+    creators = {channel_id: rng.choice(user_ids) for channel_id in channel_ids}
+    members = {channel_id: {creator} for channel_id, creator in creators.items()}
+    popularity = list(accumulate(power_law_weights(channels, popularity_exponent)))
+    for user_id in user_ids:
+        count = min(channels, max(1, round(rng.expovariate(1 / memberships))))
+        joined = set()
+        # 热门频道会被重复抽中，限制尝试次数
+        for _ in range(count * 5):
+            joined.add(channel_ids[weighted_index(rng, popularity)])
+            if len(joined) >= count:
+                break
+        for channel_id in joined:
+            members[channel_id].add(user_id)
+
+    insert_chunks(Channel, ({
+        'id': channel_id,
+        'name': f'{rng.choice(CHANNEL_TOPICS)}频道{channel_id}',
+        'description': ' '.join(rng.choices(WORDS, k=6)),
+        'is_private': rng.random() < private_ratio,
+        'created_by': creators[channel_id],
+        'created_at': begin,
+        'member_count': len(members[channel_id])
+    } for channel_id in channel_ids))
+
+    # 消息：频道活跃度按幂律分布，活跃频道的排序与受欢迎程度一致，消息ID与时间同序递增
+    activity = list(accumulate(power_law_weights(channels, activity_exponent)))
+    member_lists = {channel_id: list(member_ids) for channel_id, member_ids in members.items()}
+    channel_messages = {channel_id: [] for channel_id in channel_ids}
+    contents = [' '.join(rng.choices(WORDS, k=rng.randint(2, 12))) for _ in range(CONTENT_POOL_SIZE)]
+
+    def message_rows():
+        step = days * 86400 / max(messages, 1)
+        for n in range(messages):
+            message_id = message_base + n + 1
+            channel_id = channel_ids[weighted_index(rng, activity)]
+            channel_messages[channel_id].append(message_id)
+            yield {
+                'id': message_id,
+                'content': rng.choice(contents),
+                'sender_id': rng.choice(member_lists[channel_id]),
+                'channel_id': channel_id,
+                'created_at': begin + timedelta(seconds=n * step)
+            }
+
+    # 逐行维护全文索引很慢，先去掉插入触发器，写入后整体重建索引
+    search_enabled = ensure_search_index(db.engine)
+    if search_enabled:
+        db.session.execute(db.text('DROP TRIGGER IF EXISTS messages_fts_ai'))
+    insert_chunks(Message, message_rows())
+
+    # 已读位置：多数用户读到了频道最新的消息附近，平均约有20条未读
+    def last_read(channel_id):
+        ids = channel_messages[channel_id]
+        unread = int(rng.expovariate(1 / 20))
+        return ids[-1 - unread] if unread < len(ids) else 0
+
+    insert_chunks(UserChannel, ({
+        'user_id': user_id,
+        'channel_id': channel_id,
+        'joined_at': begin,
+        'last_read_message_id': last_read(channel_id)
+    } for channel_id, member_ids in members.items() for user_id in member_ids))
+    db.session.commit()
+
+    if search_enabled:
+        ensure_search_index(db.engine)
+        rebuild_search_index(db.engine)
+
+    return {
+        'users': users,
+        'channels': channels,
+        'memberships': sum(len(member_ids) for member_ids in members.values()),
+        'messages': messages,
+        'seconds': round(time.perf_counter() - started, 2)
+    }
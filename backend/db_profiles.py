@@ -0,0 +1,83 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+# 数据库引擎配置档：连接建立时执行的PRAGMA及连接池参数
+# 通过环境变量 DB_PROFILE 选择，DATABASE_URL 指定数据库地址
+DB_PROFILES = {
+    # SQLite默认行为（回滚日志模式）
+    'default': {
+        'pragmas': {},
+        'pool': {}
+    },
+    # 生产环境：WAL模式下读写互不阻塞，写锁冲突时等待而不是立即报错
+    'production': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,           # 毫秒
+            'mmap_size': 256 * 1024 * 1024,  # 256MB
+            'cache_size': -64 * 1024,        # 负数表示KB，即64MB
+            'temp_store': 'MEMORY'
+        },
+        'pool': {
+            'pool_size': 10,
+            'max_overflow': 20,
+            'pool_timeout': 30,
+            'pool_recycle': 3600
+        }
+    }
+}
+
+DEFAULT_DATABASE_URL = 'sqlite:///../chat.db'
+DEFAULT_DB_PROFILE = 'production'
+
+# 根据环境变量生成数据库配置，写入app.config，返回所选配置档
+def configure_database(app):
+    profile_name = os.environ.get('DB_PROFILE', DEFAULT_DB_PROFILE)
+    if profile_name not in DB_PROFILES:
+        raise ValueError(f'未知的数据库配置档: {profile_name}')
+    profile = DB_PROFILES[profile_name]
+
+    database_url = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['DB_PROFILE'] = profile_name
+
+    # 异常信息中不包含SQL参数（消息内容、邮箱等），避免写入日志
+    options = {'hide_parameters': True}
+    # 内存数据库使用单连接池，不支持连接池参数
+    url = make_url(database_url)
+    if url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:'):
+        options.update(profile['pool'])
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    return profile
+
+# 在每个新连接上执行配置档中的PRAGMA
+def apply_engine_profile(engine, profile):
+    pragmas = profile['pragmas']
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+# 读取当前连接实际生效的设置，用于启动日志
+def describe_engine(engine, profile_name):
+    settings = [f'profile={profile_name}', f'url={engine.url.render_as_string(hide_password=True)}']
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as conn:
+            for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size'):
+                value = conn.exec_driver_sql(f'PRAGMA {name}').scalar()
+                settings.append(f'{name}={value}')
+    pool = engine.pool
+    if isinstance(pool, QueuePool):
+        settings.append(f'pool=QueuePool(size={pool.size()}, max_overflow={pool._max_overflow}, timeout={pool.timeout()})')
+    else:
+        settings.append(f'pool={type(pool).__name__}')
+    return ' '.join(settings)
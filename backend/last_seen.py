@@ -0,0 +1,79 @@
+from datetime import datetime
+import threading
+
+from app_logging import get_logger
+from models import db, User
+
+logger = get_logger(__name__)
+
+# 按用户ID批量更新最后活跃时间（executemany，已删除的用户直接跳过）
+UPDATE_LAST_SEEN = db.update(User.__table__).where(
+    User.__table__.c.id == db.bindparam('user_id')
+).values(last_login=db.bindparam('when'))
+
+# 用户最后活跃时间的合并写入：登录和Socket.IO连接只在内存中记录时间，
+# 由后台线程每隔 flush_interval 秒用一次批量UPDATE写入users.last_login，退出时写入剩余记录
+class LastSeenTracker:
+    def __init__(self, app, flush_interval=5.0):
+        self.app = app
+        self.flush_interval = flush_interval
+        # 用户ID -> 尚未写入数据库的最后活跃时间
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # 启动后台写入线程
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='last-seen', daemon=True)
+            self._thread.start()
+
+    # 记录用户活跃时间，返回记录的时间
+    def touch(self, user_id, when=None):
+        when = when or datetime.utcnow()
+        with self._lock:
+            current = self._pending.get(user_id)
+            if current is None or current < when:
+                self._pending[user_id] = when
+        return when
+
+    # 获取尚未写入数据库的活跃时间，没有时返回default（通常为数据库中的值）
+    def get(self, user_id, default=None):
+        with self._lock:
+            return self._pending.get(user_id, default)
+
+    # 将累积的活跃时间批量写入数据库，返回写入的用户数（需在应用上下文中调用）
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            db.session.execute(UPDATE_LAST_SEEN, [
+                {'user_id': user_id, 'when': when} for user_id, when in pending.items()
+            ])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception('last_seen_flush_failed', users=len(pending))
+            # 放回未写入的记录，下次重试（保留较新的时间）
+            for user_id, when in pending.items():
+                self.touch(user_id, when)
+            return 0
+        return len(pending)
+
+    # 停止后台线程并写入剩余记录
+    def shutdown(self):
+        if self._thread is None or self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        with self.app.app_context():
+            while not self._stop.wait(self.flush_interval):
+                self.flush()
+                db.session.remove()
+            self.flush()
+            db.session.remove()
@@ -0,0 +1,408 @@
+# 端到端压测：启动使用临时数据库的服务器进程，创建用户、频道和成员关系，
+# 由一组Socket.IO客户端加入频道并按固定速率发送消息，统计new_message送达延迟、消息吞吐量和REST接口延迟
+#
+# 用法（在backend目录下执行）：
+#   python loadtest.py --clients 50 --channels 5 --rate 2 --duration 20
+#   python loadtest.py --save-baseline loadtest-baseline.json      # 保存基准结果
+#   python loadtest.py --baseline loadtest-baseline.json           # 与基准比较，性能下降超过容差时退出码为1
+#
+# 客户端使用WebSocket传输需要安装 websocket-client，未安装时退回长轮询
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+import socketio
+
+# 压测用户的统一密码
+PASSWORD = 'loadtest-password'
+
+# 消息内容前缀，内容格式为 "loadtest <客户端编号> <序号> <发送时间>"
+MESSAGE_PREFIX = 'loadtest'
+
+# 统计的REST接口：名称 -> 路径模板（{channel_id} 为客户端所在频道）
+REST_ENDPOINTS = {
+    'channels_public': '/api/channels/public',
+    'channels_joined': '/api/channels/joined',
+    'channels_search': '/api/channels/search?q=loadtest',
+    'channel_detail': '/api/channels/{channel_id}',
+    'channel_messages': '/api/channels/{channel_id}/messages',
+    'channel_messages_search': '/api/channels/{channel_id}/messages/search?q=loadtest',
+}
+
+# 与基准比较的指标：(指标路径, 越大越好)
+def comparable_metrics(result):
+    metrics = {
+        'socket.latency_ms.p50': (result['socket']['latency_ms']['p50'], False),
+        'socket.latency_ms.p90': (result['socket']['latency_ms']['p90'], False),
+        'socket.latency_ms.p99': (result['socket']['latency_ms']['p99'], False),
+        'socket.messages_per_sec': (result['socket']['messages_per_sec'], True),
+    }
+    for name, stats in result['rest'].items():
+        metrics[f'rest.{name}.p50'] = (stats['latency_ms']['p50'], False)
+        metrics[f'rest.{name}.p90'] = (stats['latency_ms']['p90'], False)
+    return metrics
+
+# 计算延迟分布（毫秒），使用最近秩法取百分位
+def summarize(samples):
+    if not samples:
+        return {'count': 0, 'mean': None, 'p50': None, 'p90': None, 'p99': None, 'max': None}
+    samples = sorted(samples)
+
+    def percentile(p):
+        index = max(0, min(len(samples) - 1, int(round(p / 100 * len(samples) + 0.5)) - 1))
+        return round(samples[index] * 1000, 2)
+
+    return {
+        'count': len(samples),
+        'mean': round(sum(samples) / len(samples) * 1000, 2),
+        'p50': percentile(50),
+        'p90': percentile(90),
+        'p99': percentile(99),
+        'max': round(samples[-1] * 1000, 2)
+    }
+
+# 服务器进程：使用临时数据库导入应用，写入压测数据后启动Socket.IO服务器
+def serve(args):
+    os.environ['DATABASE_URL'] = f'sqlite:///{args.database}'
+    os.environ['EMAIL_TRANSPORT'] = 'fake'
+    os.environ['MESSAGE_WRITE_MODE'] = args.write_mode
+    import app as chat
+
+    # 所有客户端都来自本机同一个IP，默认关闭准入控制，否则测到的是限流速率
+    if not args.rate_limits:
+        chat.admission.limits = {}
+
+    with chat.app.app_context():
+        seed(args.users, args.channels, args.history)
+    chat.socketio.run(chat.app, host='127.0.0.1', port=args.port, log_output=False)
+
+# 写入压测数据：users个用户平均分配到channels个公开频道，每个频道预先写入history条消息
+def seed(users, channels, history):
+    from models import db, User, Channel, UserChannel, Message
+
+    # 密码哈希计算较慢，所有用户共用同一个哈希
+    template = User()
+    template.set_password(PASSWORD)
+
+    db.session.execute(db.insert(User), [{
+        'id': i + 1,
+        'username': f'loadtest{i}',
+        'email': f'loadtest{i}@example.com',
+        'email_verified': True,
+        'password_hash': template.password_hash,
+        'nickname': f'压测用户{i}'
+    } for i in range(users)])
+    db.session.execute(db.insert(Channel), [{
+        'id': c + 1,
+        'name': f'loadtest-{c}',
+        'description': 'loadtest channel',
+        'created_by': 1,
+        'member_count': len(range(c, users, channels))
+    } for c in range(channels)])
+    db.session.execute(db.insert(UserChannel), [
+        {'user_id': i + 1, 'channel_id': i % channels + 1} for i in range(users)
+    ])
+    db.session.execute(db.insert(Message), [{
+        'content': f'{MESSAGE_PREFIX} history {n}',
+        'sender_id': (n * channels + c) % users + 1,
+        'channel_id': c + 1
+    } for c in range(channels) for n in range(history)])
+    db.session.commit()
+
+# 等待服务器可以访问
+def wait_for_server(base_url, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'服务器进程已退出（退出码 {process.returncode}）')
+        try:
+            if requests.get(f'{base_url}/api/health', timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('等待服务器启动超时')
+
+# 选择一个空闲端口
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+# 单个压测客户端：登录后通过Socket.IO加入所在频道，按固定速率发送消息并记录收到消息的延迟
+class LoadClient:
+    def __init__(self, base_url, index, channel_id, stats):
+        self.base_url = base_url
+        self.index = index
+        self.channel_id = channel_id
+        self.stats = stats
+        self.sent = 0
+        self.http = requests.Session()
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on('new_message', self._on_message)
+        self.sio.on('error', self._on_error)
+
+    # 登录并建立Socket.IO连接
+    def connect(self):
+        response = self.http.post(f'{self.base_url}/api/login', json={
+            'username': f'loadtest{self.index}',
+            'password': PASSWORD
+        })
+        if response.json().get('status') != 'success':
+            raise RuntimeError(f'客户端 {self.index} 登录失败: {response.text}')
+        cookie = '; '.join(f'{name}={value}' for name, value in self.http.cookies.items())
+        self.sio.connect(self.base_url, headers={'Cookie': cookie}, wait_timeout=10)
+        self.sio.emit('join_channel', {'channel_id': self.channel_id})
+
+    # 在duration秒内每秒发送rate条消息
+    def send_loop(self, start, rate, duration):
+        for seq in range(int(rate * duration)):
+            delay = start + seq / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.sio.emit('send_message', {
+                'channel_id': self.channel_id,
+                'content': f'{MESSAGE_PREFIX} {self.index} {seq} {time.perf_counter():.6f}'
+            })
+            self.sent += 1
+
+    def disconnect(self):
+        self.sio.disconnect()
+
+    def _on_message(self, message):
+        parts = message.get('content', '').split(' ')
+        if len(parts) != 4 or parts[0] != MESSAGE_PREFIX:
+            return
+        self.stats.delivered(message['id'], time.perf_counter() - float(parts[3]))
+
+    def _on_error(self, error):
+        self.stats.error(error.get('message') if isinstance(error, dict) else error)
+
+# 各客户端共享的送达统计
+class DeliveryStats:
+    def __init__(self):
+        self.latencies = []
+        self.message_ids = set()
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def delivered(self, message_id, latency):
+        with self._lock:
+            self.latencies.append(latency)
+            self.message_ids.add(message_id)
+
+    def error(self, message):
+        with self._lock:
+            self.errors[message] = self.errors.get(message, 0) + 1
+
+# 消息发送阶段：所有客户端同时按速率发送，结束后等待drain秒接收剩余的消息
+def run_socket_phase(clients, args):
+    stats = clients[0].stats
+    # 等待所有客户端加入频道房间
+    time.sleep(args.warmup)
+    start = time.monotonic() + 0.1
+    threads = [
+        threading.Thread(target=client.send_loop, args=(start, args.rate, args.duration), daemon=True)
+        for client in clients
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 最后一条消息在 duration - 1/rate 秒时发出，按设定的持续时间计算吞吐量
+    send_time = max(time.monotonic() - start, args.duration)
+    time.sleep(args.drain)
+
+    sent = sum(client.sent for client in clients)
+    members = {}
+    for client in clients:
+        members[client.channel_id] = members.get(client.channel_id, 0) + 1
+    expected = sum(client.sent * members[client.channel_id] for client in clients)
+    with stats._lock:
+        latencies = list(stats.latencies)
+        unique = len(stats.message_ids)
+        errors = dict(stats.errors)
+    return {
+        'sent': sent,
+        'delivered_messages': unique,
+        'expected_deliveries': expected,
+        'deliveries': len(latencies),
+        'errors': errors,
+        'send_seconds': round(send_time, 2),
+        'messages_per_sec': round(unique / send_time, 1) if send_time else 0,
+        'deliveries_per_sec': round(len(latencies) / send_time, 1) if send_time else 0,
+        'latency_ms': summarize(latencies)
+    }
+
+# REST接口阶段：每个接口由concurrency个线程共发送requests次请求，轮流使用各客户端的登录会话
+def run_rest_phase(clients, args):
+    results = {}
+    for name, template in REST_ENDPOINTS.items():
+        def call(n):
+            client = clients[n % len(clients)]
+            url = client.base_url + template.format(channel_id=client.channel_id)
+            began = time.perf_counter()
+            response = client.http.get(url)
+            return time.perf_counter() - began, response.status_code
+
+        with ThreadPoolExecutor(max_workers=args.rest_concurrency) as pool:
+            outcomes = list(pool.map(call, range(args.rest_requests)))
+        results[name] = {
+            'requests': len(outcomes),
+            'errors': sum(1 for _, status in outcomes if status != 200),
+            'latency_ms': summarize([elapsed for elapsed, _ in outcomes])
+        }
+    return results
+
+# 与基准结果比较，返回性能下降的指标列表
+def compare(result, baseline, tolerance):
+    if result['config'] != baseline.get('config'):
+        print('注意：压测参数与基准不同，比较结果仅供参考')
+    current = comparable_metrics(result)
+    previous = comparable_metrics(baseline)
+    regressions = []
+    print(f"\n{'指标':<40}{'基准':>12}{'本次':>12}{'变化':>10}")
+    for name, (value, higher_is_better) in current.items():
+        base = previous.get(name, (None,))[0]
+        if value is None or not base:
+            continue
+        change = (value - base) / base
+        regressed = change < -tolerance if higher_is_better else change > tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<40}{base:>12}{value:>12}{change:>+10.1%}{'  ✗' if regressed else ''}")
+    return regressions
+
+def print_result(result):
+    socket_stats = result['socket']
+    latency = socket_stats['latency_ms']
+    print(f"\n客户端 {result['config']['clients']}，频道 {result['config']['channels']}，"
+          f"每客户端 {result['config']['rate']} 条/秒，持续 {socket_stats['send_seconds']} 秒")
+    print(f"发送 {socket_stats['sent']} 条，送达 {socket_stats['delivered_messages']} 条；"
+          f"推送 {socket_stats['deliveries']}/{socket_stats['expected_deliveries']} 次")
+    print(f"吞吐量 {socket_stats['messages_per_sec']} 条/秒，推送 {socket_stats['deliveries_per_sec']} 次/秒")
+    print(f"new_message 延迟(ms) p50={latency['p50']} p90={latency['p90']} p99={latency['p99']} max={latency['max']}")
+    if socket_stats['errors']:
+        print(f"错误: {socket_stats['errors']}")
+    print(f"\n{'接口':<28}{'请求':>8}{'错误':>6}{'p50(ms)':>10}{'p90(ms)':>10}{'p99(ms)':>10}")
+    for name, stats in result['rest'].items():
+        latency = stats['latency_ms']
+        print(f"{name:<28}{stats['requests']:>8}{stats['errors']:>6}{latency['p50']:>10}{latency['p90']:>10}{latency['p99']:>10}")
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='can-chat-loadtest-')
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    log_path = os.path.join(workdir, 'server.log')
+    command = [
+        sys.executable, os.path.abspath(__file__), '--serve',
+        '--database', os.path.join(workdir, 'loadtest.db'),
+        '--port', str(port),
+        '--users', str(args.clients),
+        '--channels', str(args.channels),
+        '--history', str(args.history),
+        '--write-mode', args.write_mode
+    ]
+    if args.rate_limits:
+        command.append('--rate-limits')
+
+    clients = []
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                   stdout=log, stderr=subprocess.STDOUT)
+    try:
+        wait_for_server(base_url, process)
+        stats = DeliveryStats()
+        clients = [
+            LoadClient(base_url, i, i % args.channels + 1, stats)
+            for i in range(args.clients)
+        ]
+        for client in clients:
+            client.connect()
+        result = {
+            'config': {
+                'clients': args.clients,
+                'channels': args.channels,
+                'rate': args.rate,
+                'duration': args.duration,
+                'history': args.history,
+                'write_mode': args.write_mode,
+                'rest_requests': args.rest_requests,
+                'rest_concurrency': args.rest_concurrency
+            },
+            'socket': run_socket_phase(clients, args),
+            'rest': run_rest_phase(clients, args)
+        }
+    finally:
+        for client in clients:
+            try:
+                client.disconnect()
+            except Exception:
+                pass
+        process.terminate()
+        process.wait(timeout=10)
+        if args.keep:
+            print(f'临时数据库和服务器日志保留在 {workdir}')
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='CAN-Chat 端到端压测')
+    parser.add_argument('--clients', type=int, default=50, help='Socket.IO客户端（用户）数量')
+    parser.add_argument('--channels', type=int, default=5, help='频道数量，客户端平均分配到各频道')
+    parser.add_argument('--rate', type=float, default=2, help='每个客户端每秒发送的消息数')
+    parser.add_argument('--duration', type=float, default=20, help='发送阶段持续的秒数')
+    parser.add_argument('--history', type=int, default=200, help='每个频道预先写入的历史消息数')
+    parser.add_argument('--write-mode', choices=('sync', 'batched'), default='sync', help='服务器的消息写入模式')
+    parser.add_argument('--rate-limits', action='store_true', help='保留服务器的准入控制')
+    parser.add_argument('--warmup', type=float, default=1, help='加入频道后开始发送前等待的秒数')
+    parser.add_argument('--drain', type=float, default=2, help='发送结束后等待剩余消息送达的秒数')
+    parser.add_argument('--rest-requests', type=int, default=200, help='每个REST接口的请求次数')
+    parser.add_argument('--rest-concurrency', type=int, default=8, help='REST请求的并发数')
+    parser.add_argument('--save-baseline', metavar='PATH', help='将结果保存为基准')
+    parser.add_argument('--baseline', metavar='PATH', help='与基准结果比较')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允许的性能下降比例')
+    parser.add_argument('--output', metavar='PATH', help='将结果保存为JSON')
+    parser.add_argument('--keep', action='store_true', help='保留临时数据库和服务器日志')
+    # 以下参数仅供内部启动服务器进程使用
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--users', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.serve:
+        serve(args)
+        return 0
+
+    result = run(args)
+    print_result(result)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        print(f'\n基准结果已保存到 {args.save_baseline}')
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions:
+            print(f'\n性能下降超过 {args.tolerance:.0%}: {", ".join(regressions)}')
+            return 1
+        print('\n未发现超过容差的性能下降')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import os
+
+from app_logging import describe_error, get_logger
+from models import db, Message
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # 未安装Pillow时不生成缩略图，客户端直接显示原图
+    Image = None
+
+logger = get_logger(__name__)
+
+# 缩略图及压缩图参数
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_QUALITY = 75
+COMPRESSED_MAX_SIZE = (1600, 1600)
+COMPRESSED_QUALITY = 80
+
+# 更新消息记录的重试次数（批量写入模式下消息可能尚未写入数据库）
+UPDATE_RETRIES = 5
+
+# 在eventlet模式下把CPU密集的图片处理交给线程池，避免阻塞事件循环
+def run_blocking(async_mode, func, *args):
+    if async_mode == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute(func, *args)
+    return func(*args)
+
+# 为图片生成缩略图和压缩的WebP版本，保存在原图旁边，返回生成的文件名
+# 动图只生成首帧缩略图
+def generate_variants(path):
+    stem = os.path.splitext(path)[0]
+    variants = {'thumbnail': None, 'image_webp': None}
+
+    # 相同内容的图片共用一份文件，已生成过时直接复用
+    if os.path.exists(f'{stem}_thumb.webp'):
+        variants['thumbnail'] = os.path.basename(f'{stem}_thumb.webp')
+        if os.path.exists(f'{stem}.webp'):
+            variants['image_webp'] = os.path.basename(f'{stem}.webp')
+        return variants
+
+    with Image.open(path) as img:
+        animated = getattr(img, 'is_animated', False)
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('LA', 'PA') else 'RGB')
+
+        thumbnail = img.copy()
+        thumbnail.thumbnail(THUMBNAIL_SIZE)
+        thumbnail.save(f'{stem}_thumb.webp', 'WEBP', quality=THUMBNAIL_QUALITY)
+        variants['thumbnail'] = os.path.basename(f'{stem}_thumb.webp')
+
+        if not animated:
+            compressed = img.copy()
+            compressed.thumbnail(COMPRESSED_MAX_SIZE)
+            compressed.save(f'{stem}.webp', 'WEBP', quality=COMPRESSED_QUALITY)
+            variants['image_webp'] = os.path.basename(f'{stem}.webp')
+    return variants
+
+# 图片消息的后台处理管道：由若干后台任务从队列取出图片，生成缩略图和压缩图，
+# 写回消息记录后向频道广播 message_media_ready 事件
+class MediaPipeline:
+    def __init__(self, app, socketio, workers=2, max_queue=100, on_ready=None):
+        self.app = app
+        self.socketio = socketio
+        # 处理完成后的回调 on_ready(channel_id, message_id, urls)
+        self.on_ready = on_ready
+        self.workers = workers
+        self.max_queue = max_queue
+        self._queue = None
+
+    # 是否可用（需要安装Pillow）
+    @property
+    def enabled(self):
+        return Image is not None
+
+    # 启动后台任务
+    def start(self):
+        if not self.enabled or self._queue is not None:
+            return
+        self._queue = self.socketio.server.eio.create_queue()
+        for _ in range(self.workers):
+            self.socketio.start_background_task(self._worker)
+
+    # 等待处理的图片数
+    def queue_size(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    # 提交图片处理任务，队列已满或不可用时返回False
+    # path为图片文件路径，url_dir为图片所在目录的访问路径
+    def submit(self, message_id, channel_id, path, url_dir):
+        if self._queue is None or self._queue.qsize() >= self.max_queue:
+            return False
+        self._queue.put({
+            'message_id': message_id,
+            'channel_id': channel_id,
+            'path': path,
+            'url_dir': url_dir
+        })
+        return True
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._process(job)
+            except Exception:
+                logger.exception('media_job_failed', message_id=job['message_id'])
+
+    def _process(self, job):
+        try:
+            variants = run_blocking(self.socketio.async_mode, generate_variants, job['path'])
+        except Exception as e:
+            logger.warning('thumbnail_failed', message_id=job['message_id'], error=describe_error(e))
+            variants = {'thumbnail': None, 'image_webp': None}
+
+        urls = {
+            key: f"{job['url_dir']}/{name}" if name else None
+            for key, name in variants.items()
+        }
+
+        with self.app.app_context():
+            for attempt in range(UPDATE_RETRIES):
+                updated = Message.query.filter_by(id=job['message_id']).update(urls)
+                db.session.commit()
+                if updated:
+                    break
+                self.socketio.sleep(0.05 * (attempt + 1))
+            db.session.remove()
+
+        if self.on_ready is not None:
+            self.on_ready(job['channel_id'], job['message_id'], urls)
+
+        self.socketio.emit('message_media_ready', {
+            'id': job['message_id'],
+            'channel_id': job['channel_id'],
+            **urls
+        }, room=str(job['channel_id']))
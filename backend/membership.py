@@ -0,0 +1,69 @@
+from collections import OrderedDict
+import threading
+import time
+
+from models import db, UserChannel
+
+# 进程内的频道成员关系缓存：user_id -> 已加入的频道ID集合
+# 首次访问时从数据库加载该用户的全部频道，按LRU淘汰最久未使用的用户
+# 加入/退出频道后需调用invalidate使缓存失效；多进程部署时可设置ttl使其他进程中的退出操作在有限时间内生效，
+# 并在未命中时重新加载一次（recheck_misses，默认在设置了ttl时启用）以识别在其他进程中刚加入的频道
+class MembershipCache:
+    def __init__(self, max_users=10000, ttl=None, recheck_misses=None):
+        self.max_users = max_users
+        self.ttl = ttl
+        self.recheck_misses = ttl is not None if recheck_misses is None else recheck_misses
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # 每次失效时递增，防止查询期间发生的失效被旧结果覆盖
+        self._generation = 0
+
+    # 检查用户是否已加入频道
+    # 单进程部署时缓存不会过期（本进程的加入操作都会使缓存失效），未命中即不是成员；
+    # 多进程部署时重新从数据库加载一次，以识别在其他进程中刚加入的频道
+    def is_member(self, user_id, channel_id):
+        try:
+            channel_id = int(channel_id)
+        except (TypeError, ValueError):
+            return False
+        if channel_id in self.get_channel_ids(user_id):
+            return True
+        if not self.recheck_misses:
+            return False
+        self.invalidate(user_id)
+        return channel_id in self.get_channel_ids(user_id)
+
+    # 获取用户已加入的频道ID集合
+    def get_channel_ids(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                self._entries.move_to_end(user_id)
+                return entry[1]
+            generation = self._generation
+
+        # 未命中时查询数据库（不持有锁）
+        rows = db.session.query(UserChannel.channel_id).filter(UserChannel.user_id == user_id).all()
+        channel_ids = frozenset(row.channel_id for row in rows)
+
+        with self._lock:
+            if generation != self._generation:
+                return channel_ids
+            expires_at = time.monotonic() + self.ttl if self.ttl else None
+            self._entries[user_id] = (expires_at, channel_ids)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return channel_ids
+
+    # 使用户的缓存失效
+    def invalidate(self, user_id):
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(user_id, None)
+
+    # 清空缓存
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
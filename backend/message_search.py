@@ -0,0 +1,109 @@
+import unicodedata
+
+from sqlalchemy.exc import OperationalError
+
+from app_logging import describe_error, get_logger
+from models import db, Message
+from serializers import message_query
+
+logger = get_logger(__name__)
+
+# 消息全文索引：外部内容FTS5表，使用trigram分词（按字符三元组索引，适用于中文等无空格分隔的文本）
+# 由触发器随messages表的增删改同步更新
+SEARCH_SCHEMA_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+    "content, content='messages', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_ai AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_ad AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_au AFTER UPDATE OF content ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); "
+    "END",
+)
+
+REBUILD_SQL = "INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')"
+
+SEARCH_SQL = db.text(
+    "SELECT messages.id FROM messages_fts "
+    "JOIN messages ON messages.id = messages_fts.rowid "
+    "WHERE messages_fts MATCH :query AND messages.channel_id = :channel_id "
+    "ORDER BY messages_fts.rank, messages.id DESC "
+    "LIMIT :limit OFFSET :offset"
+)
+
+# trigram分词要求每个搜索词至少3个字符，更短的词（如两个字的中文词）无法使用索引，
+# 改用LIKE扫描频道内最近的 SHORT_TERM_SCAN_LIMIT 条消息，按时间倒序返回
+MIN_TERM_LENGTH = 3
+SHORT_TERM_SCAN_LIMIT = 10000
+
+# 创建全文索引及同步触发器（已存在时跳过），新建时回填已有消息
+# 返回False表示当前SQLite不支持FTS5
+def ensure_search_index(engine):
+    if engine.dialect.name != 'sqlite':
+        return False
+    with engine.begin() as conn:
+        exists = conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'"
+        ).first()
+        try:
+            for sql in SEARCH_SCHEMA_SQL:
+                conn.exec_driver_sql(sql)
+        except OperationalError as e:
+            logger.warning('message_search_unavailable', error=describe_error(e))
+            return False
+        if not exists:
+            conn.exec_driver_sql(REBUILD_SQL)
+    return True
+
+# 根据messages表重建全文索引
+def rebuild_search_index(engine):
+    with engine.begin() as conn:
+        conn.exec_driver_sql(REBUILD_SQL)
+
+# 拆分搜索关键词，去掉控制字符（NUL等字符会使FTS5查询语法出错）
+def search_terms(keyword):
+    return ''.join(
+        ' ' if unicodedata.category(char) == 'Cc' else char for char in keyword
+    ).split()
+
+# 将用户输入转换为FTS5查询：按空白拆分，每个词作为短语精确匹配，多个词同时满足
+def build_match_query(terms):
+    return ' AND '.join('"' + term.replace('"', '""') + '"' for term in terms)
+
+# 在频道内搜索消息，返回 (消息行列表, 是否还有更多)
+# 所有词都足够长时按相关度排序，否则在最近的消息中按时间倒序查找
+def search_messages(channel_id, keyword, limit, offset):
+    terms = search_terms(keyword)
+    if not terms:
+        return [], False
+    if all(len(term) >= MIN_TERM_LENGTH for term in terms):
+        ids = [row.id for row in db.session.execute(SEARCH_SQL, {
+            'query': build_match_query(terms),
+            'channel_id': channel_id,
+            'limit': limit + 1,
+            'offset': offset
+        })]
+        has_more = len(ids) > limit
+        ids = ids[:limit]
+        if not ids:
+            return [], False
+        rows = {row.id: row for row in message_query().filter(Message.id.in_(ids))}
+        rows = [rows[message_id] for message_id in ids if message_id in rows]
+    else:
+        query = message_query().filter(Message.channel_id == channel_id)
+        # 通过 (channel_id, id) 索引找到扫描范围的下界，限制LIKE扫描的行数
+        lower_id = db.session.query(Message.id).filter(Message.channel_id == channel_id).order_by(
+            Message.id.desc()
+        ).offset(SHORT_TERM_SCAN_LIMIT - 1).limit(1).scalar()
+        if lower_id is not None:
+            query = query.filter(Message.id >= lower_id)
+        for term in terms:
+            query = query.filter(Message.content.contains(term, autoescape=True))
+        rows = query.order_by(Message.id.desc()).limit(limit + 1).offset(offset).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+    return rows, has_more
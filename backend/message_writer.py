@@ -0,0 +1,189 @@
+from datetime import datetime
+import queue
+import threading
+import time
+
+from app_logging import describe_error, get_logger
+from models import db, Message
+
+logger = get_logger(__name__)
+
+# 写入模式：sync 每条消息单独提交；batched 先分配ID并立即返回，由后台线程批量提交
+WRITE_MODES = ('sync', 'batched')
+
+# 批量写入失败时的重试次数
+INSERT_RETRIES = 3
+
+# 预留ID段：取序列值与现有最大消息ID中的较大者，避免与同步模式写入的消息冲突
+RESERVE_IDS_SQL = db.text(
+    "UPDATE id_sequences "
+    "SET next_value = max(next_value, (SELECT coalesce(max(id), 0) + 1 FROM messages)) + :count "
+    "WHERE name = 'messages' "
+    "RETURNING next_value"
+)
+INIT_SEQUENCE_SQL = db.text(
+    "INSERT OR IGNORE INTO id_sequences (name, next_value) VALUES ('messages', 1)"
+)
+
+# 停止后台线程的标记
+_STOP = object()
+
+# 写入队列已满
+class WriteQueueFull(Exception):
+    pass
+
+# 消息写入管道
+class MessageWriter:
+    def __init__(self, app, mode='sync', batch_size=100, flush_interval=0.005,
+                 max_queue=10000, id_block_size=1000):
+        if mode not in WRITE_MODES:
+            raise ValueError(f'未知的消息写入模式: {mode}')
+        self.app = app
+        self.mode = mode
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.id_block_size = id_block_size
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._id_lock = threading.Lock()
+        self._next_id = 0
+        self._id_limit = 0
+        self._thread = None
+        self._stopped = False
+
+    # 启动后台写入线程（仅batched模式）
+    def start(self):
+        if self.mode == 'batched' and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='message-writer', daemon=True)
+            self._thread.start()
+
+    # 等待写入数据库的消息数（batched模式）
+    def queue_size(self):
+        return self._queue.qsize()
+
+    # 写入一条消息，返回已分配ID和时间的Message对象（不绑定会话）
+    def write(self, content, sender_id, channel_id, image=None):
+        fields = {
+            'content': content,
+            'image': image,
+            'sender_id': sender_id,
+            'channel_id': int(channel_id),
+            'created_at': datetime.utcnow()
+        }
+
+        if self.mode == 'sync' or self._thread is None:
+            message = Message(**fields)
+            db.session.add(message)
+            db.session.flush()
+            # 提交前移出会话，避免提交后访问过期属性触发重新加载
+            db.session.expunge(message)
+            db.session.commit()
+            return message
+
+        if self._stopped:
+            raise WriteQueueFull()
+
+        fields['id'] = self._allocate_id()
+        try:
+            self._queue.put_nowait(fields)
+        except queue.Full:
+            raise WriteQueueFull()
+        return Message(**fields)
+
+    # 等待队列中的消息全部写入数据库
+    def flush(self):
+        if self._thread is not None:
+            self._queue.join()
+
+    # 停止后台线程并写入剩余消息
+    def shutdown(self):
+        if self._thread is None or self._stopped:
+            return
+        self._stopped = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    # 从进程内预留的ID段中分配消息ID，用尽时向数据库预留新的ID段
+    def _allocate_id(self):
+        with self._id_lock:
+            if self._next_id >= self._id_limit:
+                with db.engine.begin() as conn:
+                    conn.execute(INIT_SEQUENCE_SQL)
+                    limit = conn.execute(RESERVE_IDS_SQL, {'count': self.id_block_size}).scalar()
+                self._next_id = limit - self.id_block_size
+                self._id_limit = limit
+            message_id = self._next_id
+            self._next_id += 1
+            return message_id
+
+    # 后台线程：攒够batch_size条或等待flush_interval后批量提交
+    def _run(self):
+        with self.app.app_context():
+            stopping = False
+            while not stopping:
+                item = self._queue.get()
+                if item is _STOP:
+                    self._queue.task_done()
+                    break
+                batch = [item]
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        self._queue.task_done()
+                        stopping = True
+                        break
+                    batch.append(item)
+                self._insert(batch)
+
+            # 写入停止标记之后仍在队列中的消息
+            batch = []
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    continue
+                batch.append(item)
+            if batch:
+                self._insert(batch)
+            db.session.remove()
+
+    # 在一个事务中插入一批消息，失败时重试；仍然失败时逐条插入，只丢弃无法写入的消息
+    def _insert(self, batch):
+        try:
+            for attempt in range(INSERT_RETRIES):
+                try:
+                    db.session.execute(db.insert(Message), batch)
+                    db.session.commit()
+                    return
+                except Exception as e:
+                    db.session.rollback()
+                    logger.warning('message_batch_retry', attempt=attempt + 1, messages=len(batch), error=describe_error(e))
+                    time.sleep(0.05 * (attempt + 1))
+            self._insert_each(batch)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    # 逐条插入（每条单独提交），避免一条无法写入的消息导致整批丢失
+    def _insert_each(self, batch):
+        dropped = 0
+        for fields in batch:
+            try:
+                db.session.execute(db.insert(Message), [fields])
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                dropped += 1
+                logger.error('message_dropped', message_id=fields['id'], channel_id=fields['channel_id'],
+                             error=describe_error(e))
+        if dropped:
+            logger.error('message_batch_dropped', messages=dropped)
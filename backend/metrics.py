@@ -0,0 +1,184 @@
+from bisect import bisect_left
+import inspect
+import threading
+import time
+
+from flask import g, request
+
+# 请求和事件耗时的直方图分桶（秒）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# 每次请求SQL语句数量的直方图分桶
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# 标签值转义（Prometheus文本格式）
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labelnames, labels, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# 计数器：按标签值累加
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+# 直方图：每组标签值记录各分桶的计数、总和与次数
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # 标签值 -> [各分桶计数..., +Inf分桶计数, 总和]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((labels, list(entry)) for labels, entry in self._values.items())
+        for labels, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), entry):
+                cumulative += count
+                le = 'le="' + _format_value(float(bound)) + '"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {_format_value(entry[-1])}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+# 采集时计算的指标：collect返回 {标签值元组: 数值}
+class Collected:
+    def __init__(self, name, documentation, collect, labelnames=(), kind='gauge'):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+        self.labelnames = labelnames
+        self.kind = kind
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+# 指标注册表，按Prometheus文本格式输出
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    # 采集时调用collect获取数值的指标（连接数、队列长度等）
+    def collected(self, name, documentation, collect, labelnames=(), kind='gauge'):
+        return self._register(Collected(name, documentation, collect, labelnames, kind))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+# 应用的请求、Socket.IO事件、数据库查询和上传指标
+# HTTP请求通过before_request/after_request统计，Socket.IO事件由track_socket_event包装处理函数统计，
+# SQL语句数量读取QueryAccounting记录的flask.g.query_log
+class AppMetrics:
+    def __init__(self):
+        self.registry = Registry()
+        self.http_duration = self.registry.histogram(
+            'http_request_duration_seconds', 'HTTP请求处理耗时', ('method', 'route', 'status'))
+        self.socket_events = self.registry.counter(
+            'socketio_events_total', 'Socket.IO事件处理次数', ('event', 'outcome'))
+        self.socket_duration = self.registry.histogram(
+            'socketio_event_duration_seconds', 'Socket.IO事件处理耗时', ('event',))
+        self.db_queries = self.registry.histogram(
+            'db_queries_per_request', '每次HTTP请求或Socket.IO事件执行的SQL语句数量', ('kind', 'name'),
+            buckets=QUERY_COUNT_BUCKETS)
+        self.upload_bytes = self.registry.counter(
+            'upload_bytes_total', '上传请求的字节数', ('kind',))
+
+    # 注册Flask请求钩子
+    def init_app(self, app):
+        @app.before_request
+        def start_request_timer():
+            g.metrics_started = time.perf_counter()
+
+        @app.after_request
+        def record_request(response):
+            started = g.pop('metrics_started', None)
+            if started is not None:
+                route = request.url_rule.rule if request.url_rule else 'unmatched'
+                self.http_duration.observe(time.perf_counter() - started, request.method, route, str(response.status_code))
+                self.db_queries.observe(self._query_count(), 'http', route)
+            return response
+
+    # 包装Socket.IO事件处理函数，统计次数、耗时和SQL语句数量
+    def track_socket_event(self, name):
+        def decorator(handler):
+            # connect事件会先尝试传入auth参数，出现TypeError时再无参数调用，
+            # 这里按处理函数的参数个数截取，避免同一事件统计两次
+            arity = len(inspect.signature(handler).parameters)
+
+            def wrapper(*args):
+                started = time.perf_counter()
+                outcome = 'ok'
+                try:
+                    return handler(*args[:arity])
+                except Exception:
+                    outcome = 'exception'
+                    raise
+                finally:
+                    self.socket_duration.observe(time.perf_counter() - started, name)
+                    self.socket_events.inc(name, outcome)
+                    self.db_queries.observe(self._query_count(), 'socketio', name)
+            wrapper.__name__ = handler.__name__
+            return wrapper
+        return decorator
+
+    # 当前请求或事件执行的SQL语句数量
+    def _query_count(self):
+        log = g.get('query_log')
+        return log.count if log is not None else 0
@@ -0,0 +1,26 @@
+"""Add (channel_id, id) index to messages
+
+Revision ID: 3f9c2a7d5b1e
+Revises: 0424bbe7b4ec
+Create Date: 2026-10-18 09:12:04.318275
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9c2a7d5b1e'
+down_revision = '0424bbe7b4ec'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.create_index('ix_messages_channel_id_id', ['channel_id', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_channel_id_id')
@@ -0,0 +1,32 @@
+"""Add member_count to channels
+
+Revision ID: 8d41e6b2c9a0
+Revises: 3f9c2a7d5b1e
+Create Date: 2026-10-18 10:03:27.540913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41e6b2c9a0'
+down_revision = '3f9c2a7d5b1e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('channels', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('member_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # 根据现有成员关系回填成员数量
+    op.execute(
+        'UPDATE channels SET member_count = '
+        '(SELECT COUNT(*) FROM user_channels WHERE user_channels.channel_id = channels.id)'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('channels', schema=None) as batch_op:
+        batch_op.drop_column('member_count')
@@ -0,0 +1,50 @@
+"""Add FTS5 full-text index over channel name and description
+
+Revision ID: a2d6f8e4b0c5
+Revises: e5a9b3c1f7d2
+Create Date: 2026-10-18 15:08:51.229604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2d6f8e4b0c5'
+down_revision = 'e5a9b3c1f7d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS channels_fts USING fts5("
+        "name, description, content='channels', content_rowid='id', tokenize='trigram')"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS channels_fts_ai AFTER INSERT ON channels BEGIN "
+        "INSERT INTO channels_fts(rowid, name, description) VALUES (new.id, new.name, new.description); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS channels_fts_ad AFTER DELETE ON channels BEGIN "
+        "INSERT INTO channels_fts(channels_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); "
+        "END"
+    )
+    op.execute(
+        "CREATE TRIGGER IF NOT EXISTS channels_fts_au AFTER UPDATE OF name, description ON channels BEGIN "
+        "INSERT INTO channels_fts(channels_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); "
+        "INSERT INTO channels_fts(rowid, name, description) VALUES (new.id, new.name, new.description); "
+        "END"
+    )
+    # 回填已有频道
+    op.execute("INSERT INTO channels_fts(channels_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS channels_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS channels_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS channels_fts_ai")
+    op.execute("DROP TABLE IF EXISTS channels_fts")
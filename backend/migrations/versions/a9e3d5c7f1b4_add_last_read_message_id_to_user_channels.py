@@ -0,0 +1,32 @@
+"""Add last_read_message_id to user_channels
+
+Revision ID: a9e3d5c7f1b4
+Revises: f4a8c2e6b9d1
+Create Date: 2026-10-18 19:02:44.918306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9e3d5c7f1b4'
+down_revision = 'f4a8c2e6b9d1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user_channels', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_read_message_id', sa.Integer(), nullable=False, server_default='0'))
+
+    # 升级前的消息视为已读，避免所有频道显示大量未读
+    op.execute(
+        'UPDATE user_channels SET last_read_message_id = '
+        '(SELECT COALESCE(MAX(id), 0) FROM messages WHERE messages.channel_id = user_channels.channel_id)'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('user_channels', schema=None) as batch_op:
+        batch_op.drop_column('last_read_message_id')
@@ -0,0 +1,32 @@
+"""Add indexes on users.avatar and messages.image
+
+Revision ID: b1c5e7a3d9f2
+Revises: a9e3d5c7f1b4
+Create Date: 2026-10-18 20:14:37.602913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b1c5e7a3d9f2'
+down_revision = 'a9e3d5c7f1b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index('ix_users_avatar', ['avatar'], unique=False)
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.create_index('ix_messages_image', ['image'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_image')
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index('ix_users_avatar')
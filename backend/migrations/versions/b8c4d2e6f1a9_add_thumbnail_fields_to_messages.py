@@ -0,0 +1,28 @@
+"""Add thumbnail and image_webp fields to messages
+
+Revision ID: b8c4d2e6f1a9
+Revises: a2d6f8e4b0c5
+Create Date: 2026-10-18 16:52:30.871146
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8c4d2e6f1a9'
+down_revision = 'a2d6f8e4b0c5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('thumbnail', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('image_webp', sa.String(length=255), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_column('image_webp')
+        batch_op.drop_column('thumbnail')
@@ -0,0 +1,31 @@
+"""Add id_sequences table
+
+Revision ID: c7e2f0a4d8b3
+Revises: 8d41e6b2c9a0
+Create Date: 2026-10-18 11:26:45.102877
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e2f0a4d8b3'
+down_revision = '8d41e6b2c9a0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 应用启动时的db.create_all()可能已创建该表
+    if sa.inspect(op.get_bind()).has_table('id_sequences'):
+        return
+    op.create_table('id_sequences',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('next_value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('id_sequences')
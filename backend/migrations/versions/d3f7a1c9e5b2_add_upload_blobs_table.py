@@ -0,0 +1,34 @@
+"""Add upload_blobs table
+
+Revision ID: d3f7a1c9e5b2
+Revises: b8c4d2e6f1a9
+Create Date: 2026-10-18 18:21:06.417390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f7a1c9e5b2'
+down_revision = 'b8c4d2e6f1a9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 应用启动时的db.create_all()可能已创建该表
+    if sa.inspect(op.get_bind()).has_table('upload_blobs'):
+        return
+    op.create_table('upload_blobs',
+    sa.Column('hash', sa.String(length=64), nullable=False),
+    sa.Column('path', sa.String(length=255), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('hash')
+    )
+
+
+def downgrade():
+    op.drop_table('upload_blobs')
@@ -0,0 +1,26 @@
+"""Add profile_version to users
+
+Revision ID: f4a8c2e6b9d1
+Revises: d3f7a1c9e5b2
+Create Date: 2026-10-18 18:21:07.412583
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4a8c2e6b9d1'
+down_revision = 'd3f7a1c9e5b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('profile_version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('profile_version')
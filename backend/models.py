@@ -21,6 +21,13 @@ class User(db.Model):
     bio = db.Column(db.Text, default='')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime, default=datetime.utcnow)
+    # 昵称或头像每次修改时递增，客户端据此判断缓存的用户资料是否过期
+    profile_version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    
+    # 索引：释放上传文件引用时统计仍引用该文件的头像
+    __table_args__ = (
+        db.Index('ix_users_avatar', 'avatar'),
+    )
     
     # 密码加密
     def set_password(self, password):
@@ -44,6 +51,8 @@ class Channel(db.Model):
     is_private = db.Column(db.Boolean, default=False)
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # 成员数量（冗余字段，由加入/退出频道时同步维护）
+    member_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     
     # 关系
     users = db.relationship('User', secondary='user_channels', back_populates='channels')
@@ -56,6 +65,8 @@ class UserChannel(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
     channel_id = db.Column(db.Integer, db.ForeignKey('channels.id'), primary_key=True)
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # 已读到的最新消息ID，之后的消息计为未读
+    last_read_message_id = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
 # 消息模型
 class Message(db.Model):
@@ -64,10 +75,36 @@ class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     content = db.Column(db.Text, nullable=False, default='')
     image = db.Column(db.String(255), nullable=True)
+    # 图片消息的缩略图和压缩版本（后台生成）
+    thumbnail = db.Column(db.String(255), nullable=True)
+    image_webp = db.Column(db.String(255), nullable=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     channel_id = db.Column(db.Integer, db.ForeignKey('channels.id'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # 索引：按频道分页读取消息历史（keyset分页）；释放上传文件引用时统计仍引用该图片的消息
+    __table_args__ = (
+        db.Index('ix_messages_channel_id_id', 'channel_id', 'id'),
+        db.Index('ix_messages_image', 'image'),
+    )
+    
     # 关系
     sender = db.relationship('User', back_populates='messages')
     channel = db.relationship('Channel', back_populates='messages')
+
+# ID序列表（批量写入消息时预先分配ID段）
+class IdSequence(db.Model):
+    __tablename__ = 'id_sequences'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False)
+
+# 上传文件（按内容哈希去重存储）
+class UploadBlob(db.Model):
+    __tablename__ = 'upload_blobs'
+    
+    hash = db.Column(db.String(64), primary_key=True)
+    path = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,138 @@
+import threading
+
+# 频道ID统一为整数（客户端可能传入字符串），无效时返回None
+def _channel_key(channel_id):
+    try:
+        return int(channel_id)
+    except (TypeError, ValueError):
+        return None
+
+# 单个连接的在线信息，使用__slots__减少每个连接占用的内存
+class _Connection:
+    __slots__ = ('user_id', 'channels')
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        # 连接订阅的频道ID（通常只有几个，元组比集合更省内存）
+        self.channels = ()
+
+# 在线状态登记：socket sid -> 用户 -> 频道
+# 同一用户的多个连接（多个标签页）只计一次在线，全部断开后才算离线
+# 在线变化先累积，由后台任务每隔 interval 秒按频道合并后广播 presence_diff 事件
+# 注意：只记录当前进程的连接，多进程部署时各进程分别统计
+class PresenceRegistry:
+    def __init__(self, socketio, interval=1.0):
+        self.socketio = socketio
+        self.interval = interval
+        self._connections = {}
+        # 频道ID -> {用户ID: 连接数}
+        self._channels = {}
+        # 待广播的在线变化：频道ID -> {用户ID: 是否在线}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._started = False
+
+    # 启动广播在线变化的后台任务
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        self.socketio.start_background_task(self._run)
+
+    # 登记新连接
+    def connect(self, sid, user_id):
+        with self._lock:
+            self._connections[sid] = _Connection(user_id)
+
+    # 连接断开，从其订阅的所有频道中移除
+    def disconnect(self, sid):
+        with self._lock:
+            connection = self._connections.pop(sid, None)
+            if connection is None:
+                return
+            for channel_id in connection.channels:
+                self._remove(channel_id, connection.user_id)
+
+    # 连接订阅频道
+    def join(self, sid, channel_id):
+        channel_id = _channel_key(channel_id)
+        if channel_id is None:
+            return
+        with self._lock:
+            connection = self._connections.get(sid)
+            if connection is None or channel_id in connection.channels:
+                return
+            connection.channels += (channel_id,)
+            users = self._channels.setdefault(channel_id, {})
+            users[connection.user_id] = users.get(connection.user_id, 0) + 1
+            if users[connection.user_id] == 1:
+                self._mark(channel_id, connection.user_id, True)
+
+    # 连接取消订阅频道
+    def leave(self, sid, channel_id):
+        channel_id = _channel_key(channel_id)
+        if channel_id is None:
+            return
+        with self._lock:
+            connection = self._connections.get(sid)
+            if connection is None or channel_id not in connection.channels:
+                return
+            connection.channels = tuple(c for c in connection.channels if c != channel_id)
+            self._remove(channel_id, connection.user_id)
+
+    # 频道内在线的用户ID列表
+    def online_users(self, channel_id):
+        with self._lock:
+            return list(self._channels.get(channel_id, ()))
+
+    # 当前连接数
+    def connection_count(self):
+        return len(self._connections)
+
+    # 各频道的在线用户数：{频道ID: 用户数}
+    def room_sizes(self):
+        with self._lock:
+            return {channel_id: len(users) for channel_id, users in self._channels.items()}
+
+    # 取出并清空待广播的在线变化：[(频道ID, 上线用户, 离线用户)]
+    def drain(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        diffs = []
+        for channel_id, changes in pending.items():
+            online = [user_id for user_id, is_online in changes.items() if is_online]
+            offline = [user_id for user_id, is_online in changes.items() if not is_online]
+            diffs.append((channel_id, online, offline))
+        return diffs
+
+    # 调用方需持有锁
+    def _remove(self, channel_id, user_id):
+        users = self._channels.get(channel_id)
+        if not users or user_id not in users:
+            return
+        users[user_id] -= 1
+        if users[user_id] == 0:
+            del users[user_id]
+            if not users:
+                del self._channels[channel_id]
+            self._mark(channel_id, user_id, False)
+
+    # 记录在线变化，同一周期内先上线后离线（或相反）的变化相互抵消
+    def _mark(self, channel_id, user_id, is_online):
+        changes = self._pending.setdefault(channel_id, {})
+        if changes.get(user_id) == (not is_online):
+            del changes[user_id]
+            if not changes:
+                del self._pending[channel_id]
+        else:
+            changes[user_id] = is_online
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.interval)
+            for channel_id, online, offline in self.drain():
+                self.socketio.emit('presence_diff', {
+                    'channel_id': channel_id,
+                    'online': online,
+                    'offline': offline
+                }, room=str(channel_id))
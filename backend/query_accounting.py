@@ -0,0 +1,158 @@
+import re
+import time
+import warnings
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from app_logging import get_logger
+
+# 同一请求中重复执行相同语句的处理方式：off 不检查；warn 发出RepeatedQueryWarning；raise 抛出RepeatedQueryError
+# 未指定（None）时按应用状态选择：测试模式下raise，调试模式下warn，否则off
+REPEAT_ACTIONS = ('off', 'warn', 'raise')
+
+# 慢查询报告中列出的语句数
+SLOW_REPORT_TOP = 5
+
+logger = get_logger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+# IN列表的参数个数不同也视为同一种语句
+_IN_LIST = re.compile(r'IN \((?:\?|:\w+|%\(\w+\)s)(?:, ?(?:\?|:\w+|%\(\w+\)s))*\)', re.IGNORECASE)
+
+# 语句形态：合并空白、折叠IN列表，参数不同的同一查询得到相同的结果
+def statement_shape(statement):
+    return _IN_LIST.sub('IN (...)', _WHITESPACE.sub(' ', statement).strip())
+
+class RepeatedQueryWarning(UserWarning):
+    pass
+
+class RepeatedQueryError(AssertionError):
+    pass
+
+# 单次请求或事件执行的SQL语句记录
+class QueryLog:
+    __slots__ = ('count', 'duration', 'statements')
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        # 语句文本 -> [执行次数, 总耗时]
+        self.statements = {}
+
+    def add(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+        entry = self.statements.get(statement)
+        if entry is None:
+            self.statements[statement] = [1, duration]
+        else:
+            entry[0] += 1
+            entry[1] += duration
+
+    # 按语句形态汇总：[(形态, 执行次数, 总耗时)]，按总耗时降序
+    def by_shape(self):
+        shapes = {}
+        for statement, (count, duration) in self.statements.items():
+            entry = shapes.setdefault(statement_shape(statement), [0, 0.0])
+            entry[0] += count
+            entry[1] += duration
+        return sorted(((shape, count, duration) for shape, (count, duration) in shapes.items()),
+                      key=lambda item: item[2], reverse=True)
+
+# SQL语句统计：通过SQLAlchemy事件记录每个HTTP请求和Socket.IO事件中执行的语句数量和耗时（保存在flask.g.query_log）
+# - 数据库总耗时超过slow_threshold秒时输出慢查询报告
+# - 同一形态的语句在一次请求中执行超过repeat_limit次时（通常是循环中逐行查询的N+1问题），
+#   按repeat_action发出警告或抛出异常
+# 不在请求或事件上下文中的语句（后台线程）不统计
+class QueryAccounting:
+    def __init__(self, slow_threshold=0.1, repeat_limit=10, repeat_action=None):
+        if repeat_action is not None and repeat_action not in REPEAT_ACTIONS:
+            raise ValueError(f'未知的重复语句处理方式: {repeat_action}')
+        self.slow_threshold = slow_threshold
+        self.repeat_limit = repeat_limit
+        self.repeat_action = repeat_action
+
+    # 注册SQLAlchemy事件和Flask请求钩子
+    def init_app(self, app, engine):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def start_statement(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def record_statement(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info['query_started'].pop()
+            if has_request_context():
+                log = g.get('query_log')
+                if log is not None:
+                    log.add(statement, time.perf_counter() - started)
+
+        # 执行出错时after_cursor_execute不会触发，丢弃对应的开始时间
+        @event.listens_for(engine, 'handle_error')
+        def discard_statement(context):
+            if context.connection is not None and context.connection.info.get('query_started'):
+                context.connection.info['query_started'].pop()
+
+        @app.before_request
+        def begin_request():
+            self.begin()
+
+        @app.after_request
+        def end_request(response):
+            route = request.url_rule.rule if request.url_rule else request.path
+            self.end(f'{request.method} {route}')
+            return response
+
+    # 开始记录当前上下文中的语句
+    def begin(self):
+        g.query_log = QueryLog()
+
+    # 结束记录，检查慢查询和重复语句（记录保留在g.query_log中供其他统计读取）
+    def end(self, name):
+        log = g.get('query_log')
+        if log is None or not log.count:
+            return log
+        shapes = None
+        if log.duration >= self.slow_threshold:
+            shapes = log.by_shape()
+            logger.warning('slow_queries', request=name, statements=log.count,
+                           duration_ms=round(log.duration * 1000, 1), top=self.slow_report(shapes))
+        action = self._repeat_action()
+        if action != 'off' and log.count > self.repeat_limit:
+            shapes = shapes or log.by_shape()
+            repeated = [(shape, count) for shape, count, _ in shapes if count > self.repeat_limit]
+            if repeated:
+                message = f'{name} 中重复执行了相同的SQL语句（可能是N+1查询）：' + '；'.join(
+                    f'{count} 次 {shape}' for shape, count in repeated
+                )
+                if action == 'raise':
+                    raise RepeatedQueryError(message)
+                warnings.warn(message, RepeatedQueryWarning, stacklevel=2)
+        return log
+
+    # 包装Socket.IO事件处理函数，统计事件中执行的语句
+    def track_socket_event(self, name):
+        def decorator(handler):
+            def wrapper(*args):
+                self.begin()
+                result = handler(*args)
+                self.end(f'socketio {name}')
+                return result
+            wrapper.__wrapped__ = handler
+            wrapper.__name__ = handler.__name__
+            return wrapper
+        return decorator
+
+    def _repeat_action(self):
+        if self.repeat_action is not None:
+            return self.repeat_action
+        if current_app.testing:
+            return 'raise'
+        return 'warn' if current_app.debug else 'off'
+
+    # 慢查询报告：总耗时最多的几种语句
+    def slow_report(self, shapes):
+        return [
+            {'statement': shape[:200], 'count': count, 'duration_ms': round(duration * 1000, 1)}
+            for shape, count, duration in shapes[:SLOW_REPORT_TOP]
+        ]
@@ -0,0 +1,195 @@
+# 查询路径微基准：按指定的数据规模生成测试数据集，通过测试客户端反复调用各查询接口，
+# 统计每次调用的耗时和SQL语句数量
+#
+# 用法（在backend目录下执行）：
+#   python query_bench.py                                          # 默认规模 1000用户/100频道/10万消息
+#   python query_bench.py --sizes 1000:100:100000,10000:500:1000000 --calls 50
+#   python query_bench.py --database ../chat.db                    # 使用已有数据库（如 flask generate-data 生成的数据）
+#
+# 每种数据规模在单独的进程中使用临时数据库运行
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# 查询路径：(名称, 接口地址模板, 每次调用前执行的准备操作)
+# 地址模板中 {channel} 为消息最多的频道，{before_id} 为该频道中间位置的消息ID
+BENCHMARKS = (
+    ('public_listing', '/api/channels/public', None),
+    ('joined_listing', '/api/channels/joined', None),
+    ('channel_detail', '/api/channels/{channel}', None),
+    # 每次调用前清空频道搜索结果缓存，测量实际查询
+    ('channel_search', '/api/channels/search?q=python', lambda chat, subject: chat.channel_search_cache.clear()),
+    ('message_search', '/api/channels/{channel}/messages/search?q=数据库', None),
+    ('message_search_short', '/api/channels/{channel}/messages/search?q=好的', None),
+    ('history_latest', '/api/channels/{channel}/messages', None),
+    # 每次调用前清除频道的最近消息缓存，测量数据库查询路径
+    ('history_latest_uncached', '/api/channels/{channel}/messages',
+     lambda chat, subject: chat.recent_messages.invalidate_channels([subject['channel']])),
+    ('history_page', '/api/channels/{channel}/messages?before_id={before_id}', None),
+)
+
+# 计算耗时分布（毫秒）
+def summarize(samples):
+    samples = sorted(samples)
+
+    def percentile(p):
+        return round(samples[min(len(samples) - 1, int(p / 100 * len(samples)))] * 1000, 2)
+
+    return {
+        'mean': round(sum(samples) / len(samples) * 1000, 2),
+        'p50': percentile(50),
+        'p95': percentile(95),
+        'max': round(samples[-1] * 1000, 2)
+    }
+
+# 选择测试对象：消息最多的频道，以及该频道中加入频道数居中的成员
+def pick_subject(db):
+    channel = db.session.execute(db.text(
+        'SELECT channel_id FROM messages GROUP BY channel_id ORDER BY count(*) DESC LIMIT 1'
+    )).scalar()
+    if channel is None:
+        raise RuntimeError('数据库中没有消息')
+    members = db.session.execute(db.text(
+        'SELECT uc.user_id FROM user_channels uc '
+        'JOIN user_channels other ON other.user_id = uc.user_id '
+        'WHERE uc.channel_id = :channel GROUP BY uc.user_id ORDER BY count(*)'
+    ), {'channel': channel}).scalars().all()
+    ids = db.session.execute(db.text(
+        'SELECT id FROM messages WHERE channel_id = :channel ORDER BY id'
+    ), {'channel': channel}).scalars().all()
+    return {
+        'channel': channel,
+        'user': members[len(members) // 2],
+        'before_id': ids[len(ids) // 2]
+    }
+
+# 子进程：导入应用（使用环境变量中的数据库），按需生成数据后运行所有基准
+def run_benchmarks(args):
+    os.environ['EMAIL_TRANSPORT'] = 'fake'
+    import app as chat
+    from datagen import generate_dataset
+    from models import db
+    from sqlalchemy import event
+
+    dataset = None
+    with chat.app.app_context():
+        if args.size:
+            users, channels, messages = parse_size(args.size)
+            dataset = generate_dataset(users, channels, messages, seed=args.seed)
+        subject = pick_subject(db)
+        counts = {
+            'users': db.session.execute(db.text('SELECT count(*) FROM users')).scalar(),
+            'channels': db.session.execute(db.text('SELECT count(*) FROM channels')).scalar(),
+            'messages': db.session.execute(db.text('SELECT count(*) FROM messages')).scalar()
+        }
+
+        # 只统计当前线程执行的语句，排除后台写入线程
+        statements = []
+        current = threading.get_ident()
+
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count_statement(conn, cursor, statement, parameters, context, executemany):
+            if threading.get_ident() == current:
+                statements.append(statement)
+
+    client = chat.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = subject['user']
+
+    results = {}
+    for name, template, before_call in BENCHMARKS:
+        url = template.format(**subject)
+        samples = []
+        queries = []
+        # 第一次调用用于预热，不计入结果
+        for n in range(args.calls + 1):
+            if before_call is not None:
+                before_call(chat, subject)
+            statements.clear()
+            began = time.perf_counter()
+            response = client.get(url)
+            elapsed = time.perf_counter() - began
+            if response.status_code != 200:
+                raise RuntimeError(f'{name} 返回 {response.status_code}: {response.get_data(as_text=True)[:200]}')
+            if n:
+                samples.append(elapsed)
+                queries.append(len(statements))
+        results[name] = dict(summarize(samples), queries=round(sum(queries) / len(queries), 2))
+    return {'dataset': counts, 'generated': dataset, 'subject': subject, 'results': results}
+
+# 解析数据规模 "用户数:频道数:消息数"
+def parse_size(size):
+    users, channels, messages = (int(part) for part in size.split(':'))
+    return users, channels, messages
+
+def print_results(label, result):
+    dataset = result['dataset']
+    print(f"\n== {label}：{dataset['users']} 用户，{dataset['channels']} 频道，{dataset['messages']} 消息 ==")
+    if result['generated']:
+        print(f"生成数据耗时 {result['generated']['seconds']} 秒")
+    print(f"测试用户 {result['subject']['user']}，频道 {result['subject']['channel']}")
+    print(f"{'查询路径':<28}{'mean(ms)':>10}{'p50(ms)':>10}{'p95(ms)':>10}{'max(ms)':>10}{'SQL/次':>8}")
+    for name, stats in result['results'].items():
+        print(f"{name:<28}{stats['mean']:>10}{stats['p50']:>10}{stats['p95']:>10}{stats['max']:>10}{stats['queries']:>8}")
+
+# 在子进程中运行一种数据规模（或已有数据库），返回结果
+def run_child(args, database, size=None):
+    workdir = tempfile.mkdtemp(prefix='can-chat-bench-')
+    output = os.path.join(workdir, 'result.json')
+    command = [sys.executable, os.path.abspath(__file__), '--child', '--output', output,
+               '--calls', str(args.calls), '--seed', str(args.seed)]
+    if size:
+        command += ['--size', size]
+        database = os.path.join(workdir, 'bench.db')
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{os.path.abspath(database)}')
+    try:
+        subprocess.run(command, cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                       stdout=subprocess.DEVNULL, check=True)
+        with open(output, encoding='utf-8') as f:
+            return json.load(f)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='CAN-Chat 查询路径微基准')
+    parser.add_argument('--sizes', default='1000:100:100000', help='数据规模列表，格式为 用户数:频道数:消息数，多个规模用逗号分隔')
+    parser.add_argument('--database', help='使用已有的SQLite数据库文件，不生成数据')
+    parser.add_argument('--calls', type=int, default=30, help='每个查询路径的调用次数')
+    parser.add_argument('--seed', type=int, default=1, help='生成数据的随机数种子')
+    parser.add_argument('--json', metavar='PATH', help='将结果保存为JSON')
+    # 以下参数仅供内部启动子进程使用
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--size', help=argparse.SUPPRESS)
+    parser.add_argument('--output', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.child:
+        result = run_benchmarks(args)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False)
+        return 0
+
+    results = {}
+    if args.database:
+        results[args.database] = run_child(args, args.database)
+        print_results(args.database, results[args.database])
+    else:
+        for size in args.sizes.split(','):
+            parse_size(size)
+            results[size] = run_child(args, None, size)
+            print_results(size, results[size])
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
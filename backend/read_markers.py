@@ -0,0 +1,123 @@
+import threading
+
+from app_logging import get_logger
+from models import db, Channel, Message, UserChannel
+
+logger = get_logger(__name__)
+
+# 只前移已读位置（SQLite的两参数max取较大值；已退出频道的记录直接跳过）
+# 已读位置不超过频道内最新的消息ID，客户端传入过大的ID不会使之后的新消息都显示为已读
+UPDATE_READ_MARKER = db.update(UserChannel.__table__).where(
+    UserChannel.__table__.c.user_id == db.bindparam('uid'),
+    UserChannel.__table__.c.channel_id == db.bindparam('cid')
+).values(
+    last_read_message_id=db.func.max(
+        UserChannel.__table__.c.last_read_message_id,
+        db.func.min(
+            db.bindparam('message_id'),
+            db.func.coalesce(
+                db.select(db.func.max(Message.id)).where(Message.channel_id == db.bindparam('cid')).scalar_subquery(),
+                0
+            )
+        )
+    )
+)
+
+# 频道内最新的消息ID（只读取 (channel_id, id) 索引）
+def latest_message_id(channel_id):
+    return db.session.query(db.func.max(Message.id)).filter(Message.channel_id == channel_id).scalar() or 0
+
+# 查询用户已加入的频道及未读数量，返回 [(频道, 已读位置, 未读数量)]
+# 一次分组查询完成：每个频道按 (channel_id, id) 索引只扫描已读位置之后的消息
+def joined_channels_with_unread(user_id):
+    return db.session.query(
+        Channel,
+        UserChannel.last_read_message_id,
+        db.func.count(Message.id)
+    ).join(
+        UserChannel, UserChannel.channel_id == Channel.id
+    ).outerjoin(
+        Message, db.and_(
+            Message.channel_id == UserChannel.channel_id,
+            Message.id > UserChannel.last_read_message_id
+        )
+    ).filter(
+        UserChannel.user_id == user_id
+    ).group_by(Channel.id).order_by(Channel.created_at.desc()).all()
+
+# 已读位置的合并写入：标记已读只在内存中记录每个 (用户, 频道) 的最大消息ID，
+# 由后台线程每隔 flush_interval 秒批量写入user_channels
+class ReadMarkerTracker:
+    def __init__(self, app, flush_interval=2.0):
+        self.app = app
+        self.flush_interval = flush_interval
+        # (用户ID, 频道ID) -> 已读到的消息ID
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # 启动后台写入线程
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='read-markers', daemon=True)
+            self._thread.start()
+
+    # 记录用户在频道中已读到的消息
+    def mark(self, user_id, channel_id, message_id):
+        key = (user_id, int(channel_id))
+        with self._lock:
+            if self._pending.get(key, 0) < message_id:
+                self._pending[key] = message_id
+
+    # 将累积的已读位置批量写入数据库，指定user_id时只写入该用户的记录（需在应用上下文中调用）
+    def flush(self, user_id=None):
+        with self._lock:
+            if user_id is None:
+                pending, self._pending = self._pending, {}
+            else:
+                pending = {key: value for key, value in self._pending.items() if key[0] == user_id}
+                for key in pending:
+                    del self._pending[key]
+        if not pending:
+            return 0
+        rows = [
+            {'uid': uid, 'cid': cid, 'message_id': message_id}
+            for (uid, cid), message_id in pending.items()
+        ]
+        try:
+            db.session.execute(UPDATE_READ_MARKER, rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception('read_marker_flush_failed', markers=len(rows))
+            return self._flush_each(rows)
+        return len(rows)
+
+    # 批量写入失败时逐条写入，写入失败的记录直接丢弃（放回会使之后每次批量写入都失败）
+    def _flush_each(self, rows):
+        written = 0
+        for row in rows:
+            try:
+                db.session.execute(UPDATE_READ_MARKER, row)
+                db.session.commit()
+                written += 1
+            except Exception:
+                db.session.rollback()
+                logger.exception('read_marker_dropped', user_id=row['uid'], channel_id=row['cid'])
+        return written
+
+    # 停止后台线程并写入剩余记录
+    def shutdown(self):
+        if self._thread is None or self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        with self.app.app_context():
+            while not self._stop.wait(self.flush_interval):
+                self.flush()
+                db.session.remove()
+            self.flush()
+            db.session.remove()
@@ -0,0 +1,199 @@
+from bisect import bisect_left, insort
+from collections import OrderedDict
+import threading
+
+from models import Message
+from serializers import message_query, serialize_message, serialize_senders
+
+# 每条缓存消息的固定开销估算（字典、元组及整数对象），加上字符串字段的长度作为占用内存
+ENTRY_OVERHEAD = 600
+
+# 估算一条缓存消息占用的内存
+def _entry_size(payload):
+    return ENTRY_OVERHEAD + sum(len(value) for value in payload.values() if isinstance(value, str))
+
+# 单个频道的最近消息，按消息ID升序保存 (消息ID, 消息数据, 发送者资料)
+# floor之后的该频道消息都在entries中；complete表示floor之前没有更早的消息
+class _ChannelRing:
+    __slots__ = ('floor', 'complete', 'entries', 'size')
+
+    def __init__(self, floor, complete=False):
+        self.floor = floor
+        self.complete = complete
+        self.entries = []
+        self.size = 0
+
+# 进程内的频道最近消息缓存，用于：
+# - 打开频道时直接返回最新一页消息（未命中时从数据库加载并填充缓存）
+# - 断线重连后补发错过的消息
+# 发送消息时追加；每个频道最多保留per_channel条，总占用超过max_bytes或频道数超过max_channels时
+# 按LRU淘汰最久未访问的频道；发送者资料变更时清除其所在频道的缓存
+# 只包含本进程广播的消息，多进程部署时应禁用（enabled=False），全部走数据库
+class RecentMessages:
+    def __init__(self, per_channel=200, max_channels=1000, max_bytes=64 * 1024 * 1024, enabled=True):
+        self.per_channel = per_channel
+        self.max_channels = max_channels
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self._channels = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    # 追加一条刚写入的消息（payload为广播的消息数据，sender为发送者资料）
+    # 需在广播之前调用，保证重连时要么从缓存中补发，要么收到广播
+    def append(self, payload, sender):
+        if not self.enabled:
+            return
+        # 缓存中保存与历史记录相同格式的消息数据
+        payload = {key: value for key, value in payload.items() if key not in ('type', 'media_pending')}
+        with self._lock:
+            ring = self._get_ring(payload['channel_id'], payload['id'] - 1)
+            # 并发写入时消息可能乱序到达，早于floor的消息无法保证连续，不再缓存；
+            # 在加载数据库之后、追加之前提交的消息可能已由_seed加入，跳过重复的消息
+            if payload['id'] > ring.floor and not self._contains(ring, payload['id']):
+                self._insert(ring, payload, sender)
+                self._trim(ring)
+            self._evict()
+
+    # 更新缓存中的消息字段（如生成缩略图后）
+    def update_message(self, channel_id, message_id, fields):
+        with self._lock:
+            ring = self._channels.get(channel_id)
+            if ring is None:
+                return
+            for entry_id, payload, _ in ring.entries:
+                if entry_id == message_id:
+                    delta = -_entry_size(payload)
+                    payload.update(fields)
+                    delta += _entry_size(payload)
+                    ring.size += delta
+                    self._size += delta
+                    return
+
+    # 清除频道缓存（频道成员的资料变更后调用）
+    def invalidate_channels(self, channel_ids):
+        with self._lock:
+            for channel_id in channel_ids:
+                ring = self._channels.pop(channel_id, None)
+                if ring is not None:
+                    self._size -= ring.size
+
+    # 当前缓存的 (频道数, 消息数, 估算字节数)
+    def stats(self):
+        with self._lock:
+            return len(self._channels), sum(len(ring.entries) for ring in self._channels.values()), self._size
+
+    # 获取频道最新的limit条消息，返回 (消息列表, 发送者资料, 是否还有更多)
+    # 缓存不足时按 (channel_id, id) 索引查询数据库，并用结果填充缓存
+    def latest_page(self, channel_id, limit):
+        if self.enabled:
+            with self._lock:
+                ring = self._channels.get(channel_id)
+                if ring is not None and (len(ring.entries) > limit or ring.complete):
+                    self._channels.move_to_end(channel_id)
+                    entries = ring.entries[-limit:]
+                    has_more = len(ring.entries) > limit
+                    users = {sender['id']: sender for _, _, sender in entries}
+                    return [payload for _, payload, _ in entries], users, has_more
+
+        rows = message_query().filter(
+            Message.channel_id == channel_id
+        ).order_by(Message.id.desc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        if self.enabled:
+            self._seed(channel_id, rows, complete=not has_more)
+        rows = rows[:limit][::-1]
+        return [serialize_message(row) for row in rows], serialize_senders(rows), has_more
+
+    # 查询频道中ID大于after_id的消息，返回 (消息列表, 发送者资料, 是否还有更多)
+    # 缓存完整覆盖时直接返回缓存，否则按 (channel_id, id) 索引查询数据库，
+    # 并补上缓存中尚未写入数据库的消息（批量写入模式）
+    def replay(self, channel_id, after_id, limit):
+        entries, covered = self._since(channel_id, after_id)
+        if covered and len(entries) <= limit:
+            users = {sender['id']: sender for _, _, sender in entries}
+            return [payload for _, payload, _ in entries], users, False
+
+        rows = message_query().filter(
+            Message.channel_id == channel_id,
+            Message.id > after_id
+        ).order_by(Message.id.asc()).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        messages = [serialize_message(row) for row in rows]
+        users = serialize_senders(rows)
+
+        if not has_more:
+            stored = {message['id'] for message in messages}
+            for message_id, payload, sender in entries:
+                if message_id not in stored:
+                    messages.append(payload)
+                    users.setdefault(sender['id'], sender)
+            messages.sort(key=lambda message: message['id'])
+            has_more = len(messages) > limit
+            messages = messages[:limit]
+        return messages, users, has_more
+
+    # 获取频道中ID大于after_id的缓存消息；covered表示缓存是否完整覆盖了这段范围
+    def _since(self, channel_id, after_id):
+        if not self.enabled:
+            return [], False
+        with self._lock:
+            ring = self._channels.get(channel_id)
+            if ring is None:
+                return [], False
+            entries = [entry for entry in ring.entries if entry[0] > after_id]
+            return entries, after_id >= ring.floor
+
+    # 用数据库查询出的最新消息（按ID倒序）填充缓存，与已缓存的消息合并
+    def _seed(self, channel_id, rows, complete):
+        senders = serialize_senders(rows)
+        with self._lock:
+            ring = self._get_ring(channel_id, rows[-1].id - 1 if rows else 0)
+            cached = {entry[0] for entry in ring.entries}
+            for row in rows:
+                if row.id not in cached:
+                    self._insert(ring, serialize_message(row), senders[row.sender_id])
+            if complete:
+                ring.floor = 0
+                ring.complete = True
+            elif rows:
+                ring.floor = min(ring.floor, rows[-1].id - 1)
+            self._trim(ring)
+            self._evict()
+
+    # 获取频道缓存，不存在时以floor新建；并标记为最近使用（调用方需持有锁）
+    def _get_ring(self, channel_id, floor):
+        ring = self._channels.get(channel_id)
+        if ring is None:
+            ring = self._channels[channel_id] = _ChannelRing(floor)
+        self._channels.move_to_end(channel_id)
+        return ring
+
+    # 缓存中是否已有该消息（entries按消息ID升序，调用方需持有锁）
+    def _contains(self, ring, message_id):
+        index = bisect_left(ring.entries, message_id, key=lambda entry: entry[0])
+        return index < len(ring.entries) and ring.entries[index][0] == message_id
+
+    # 调用方需持有锁
+    def _insert(self, ring, payload, sender):
+        insort(ring.entries, (payload['id'], payload, sender), key=lambda entry: entry[0])
+        size = _entry_size(payload)
+        ring.size += size
+        self._size += size
+
+    # 超出单个频道的条数上限时丢弃最早的消息（调用方需持有锁）
+    def _trim(self, ring):
+        while len(ring.entries) > self.per_channel:
+            message_id, payload, _ = ring.entries.pop(0)
+            size = _entry_size(payload)
+            ring.size -= size
+            self._size -= size
+            ring.floor = message_id
+            ring.complete = False
+
+    # 超出频道数或内存上限时淘汰最久未使用的频道（调用方需持有锁）
+    def _evict(self):
+        while self._channels and (len(self._channels) > self.max_channels or self._size > self.max_bytes):
+            _, ring = self._channels.popitem(last=False)
+            self._size -= ring.size
@@ -0,0 +1,88 @@
+from models import db, User, Message
+
+# 消息序列化所需的列（只取需要的发送者字段，不加载完整ORM实体）
+MESSAGE_COLUMNS = (
+    Message.id,
+    Message.content,
+    Message.image,
+    Message.thumbnail,
+    Message.image_webp,
+    Message.sender_id,
+    Message.channel_id,
+    Message.created_at,
+    User.nickname.label('sender_nickname'),
+    User.avatar.label('sender_avatar'),
+    User.profile_version.label('sender_version'),
+)
+
+# 查询消息并关联发送者信息，一次查询完成
+def message_query():
+    return db.session.query(*MESSAGE_COLUMNS).join(User, Message.sender_id == User.id)
+
+# 将消息行序列化为字典（发送者资料只保留ID和版本号，完整资料见 serialize_senders）
+def serialize_message(row):
+    return {
+        'id': row.id,
+        'content': row.content,
+        'image': row.image,
+        'thumbnail': row.thumbnail,
+        'image_webp': row.image_webp,
+        'sender_id': row.sender_id,
+        'sender_version': row.sender_version,
+        'channel_id': row.channel_id,
+        'created_at': row.created_at.isoformat()
+    }
+
+# 从消息行中提取去重后的发送者资料：用户ID -> 资料
+def serialize_senders(rows):
+    return {
+        row.sender_id: {
+            'id': row.sender_id,
+            'nickname': row.sender_nickname,
+            'avatar': row.sender_avatar,
+            'version': row.sender_version
+        }
+        for row in rows
+    }
+
+# 将用户（或包含相同字段的查询行）序列化为公开资料
+def serialize_profile(user):
+    return {
+        'id': user.id,
+        'nickname': user.nickname,
+        'avatar': user.avatar,
+        'version': user.profile_version
+    }
+
+# 获取发送者的公开资料字段（可直接传给serialize_profile）
+def get_sender(user_id):
+    return db.session.query(
+        User.id, User.nickname, User.avatar, User.profile_version
+    ).filter(User.id == user_id).first()
+
+# 构建广播用的新消息数据（message为消息写入管道返回的对象）
+def build_message_payload(message, sender):
+    return {
+        'id': message.id,
+        'type': 'message',
+        'content': message.content,
+        'image': message.image,
+        'thumbnail': message.thumbnail,
+        'image_webp': message.image_webp,
+        'sender_id': message.sender_id,
+        'sender_version': sender.profile_version,
+        'channel_id': message.channel_id,
+        'created_at': message.created_at.isoformat()
+    }
+
+# 将频道序列化为字典（成员数量取自冗余的member_count字段）
+def serialize_channel(channel):
+    return {
+        'id': channel.id,
+        'name': channel.name,
+        'description': channel.description,
+        'is_private': channel.is_private,
+        'created_by': channel.created_by,
+        'created_at': channel.created_at.isoformat(),
+        'user_count': channel.member_count
+    }
@@ -0,0 +1,84 @@
+import atexit
+import errno
+import glob
+import os
+import socket as std_socket
+
+from socketio import PubSubManager
+
+# 单个数据报的最大长度（受系统套接字缓冲区限制）
+MAX_DATAGRAM_SIZE = 256 * 1024
+
+# 本地跨进程广播：同一目录下每个进程绑定一个Unix数据报套接字，发布时逐个发送给其他进程
+# 无需独立的消息代理，适用于单机多进程部署和测试；跨机器部署请使用redis://等消息队列
+class UnixSocketManager(PubSubManager):
+    name = 'unix'
+
+    def __init__(self, url='unix:///tmp/can-chat-sockets', channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.directory = url[len('unix://'):] if url.startswith('unix://') else url
+        self.path = os.path.join(self.directory, f'{channel}-{self.host_id}.sock')
+        self.sock = None
+        self.socket_module = std_socket
+
+    def initialize(self):
+        # eventlet模式下使用协作式套接字，避免阻塞事件循环
+        if getattr(self.server, 'async_mode', None) == 'eventlet':
+            from eventlet.green import socket as green_socket
+            self.socket_module = green_socket
+        os.makedirs(self.directory, exist_ok=True)
+        self.sock = self.socket_module.socket(std_socket.AF_UNIX, std_socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        atexit.register(self.close)
+        super().initialize()
+
+    # 关闭套接字并删除套接字文件
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    # 当前目录下其他进程的套接字文件
+    def _peers(self):
+        pattern = os.path.join(self.directory, f'{self.channel}-*.sock')
+        return [path for path in glob.glob(pattern) if path != self.path]
+
+    def _publish(self, data):
+        payload = self.json.dumps(data).encode()
+        sender = self.socket_module.socket(std_socket.AF_UNIX, std_socket.SOCK_DGRAM)
+        try:
+            for peer in self._peers():
+                try:
+                    sender.sendto(payload, peer)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # 对应进程已退出，清理残留的套接字文件
+                    try:
+                        os.unlink(peer)
+                    except FileNotFoundError:
+                        pass
+                except OSError as e:
+                    if e.errno != errno.EMSGSIZE:
+                        raise
+                    self._get_logger().error(f'广播消息过大（{len(payload)}字节），未发送到 {peer}')
+        finally:
+            sender.close()
+
+    def _listen(self):
+        while True:
+            data = self.sock.recv(MAX_DATAGRAM_SIZE)
+            try:
+                yield self.json.loads(data.decode())
+            except ValueError:
+                continue
+
+# 根据消息队列地址生成SocketIO的参数：unix:// 使用本地套接字广播，其他地址交给Flask-SocketIO内置的消息队列支持
+def socketio_queue_options(url):
+    if not url:
+        return {}
+    if url.startswith('unix://'):
+        return {'client_manager': UnixSocketManager(url)}
+    return {'message_queue': url}
@@ -0,0 +1,124 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from flask import abort, request, send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # 未安装Brotli时只生成和提供gzip压缩版本
+    brotli = None
+
+# 带版本号或内容哈希的地址内容不会改变，允许浏览器长期缓存
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# 其他文件每次使用前向服务器验证（未修改时返回304）
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# 需要预压缩的文件类型（图片本身已压缩，不再处理）
+COMPRESSIBLE_EXTENSIONS = {'.js', '.css', '.svg', '.json', '.txt', '.map'}
+
+# 预压缩文件的扩展名，按优先顺序排列
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+# 版本号长度（内容哈希的前若干位）
+FINGERPRINT_LENGTH = 12
+
+# 静态文件服务：替换Flask默认的静态文件处理
+# - 模板通过 static_url() 生成带内容哈希版本号的地址，该地址可永久缓存
+# - 按内容哈希存储的上传文件（uploads目录）地址本身不变，同样永久缓存
+# - 其他请求使用基于内容的强ETag，未修改时返回304
+# - 客户端支持时返回构建时生成的 .br / .gz 预压缩版本
+class StaticAssets:
+    def __init__(self, app, uploads_prefix='img/uploads/'):
+        self.static_folder = app.static_folder
+        self.uploads_prefix = uploads_prefix
+        # 文件路径 -> ((修改时间, 大小), 内容哈希)
+        self._hashes = {}
+        app.view_functions['static'] = self.serve
+        app.add_template_global(self.url, 'static_url')
+
+    # 计算文件内容哈希，文件未变化时使用缓存结果
+    def content_hash(self, path):
+        stat = os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self._hashes.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                digest.update(chunk)
+        value = digest.hexdigest()[:FINGERPRINT_LENGTH]
+        self._hashes[path] = (key, value)
+        return value
+
+    # 生成带版本号的静态文件地址，例如 /static/css/style.css?v=3f9c2a7d5b1e
+    def url(self, filename):
+        path = safe_join(self.static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            return f'/static/{filename}'
+        return f'/static/{filename}?v={self.content_hash(path)}'
+
+    def serve(self, filename):
+        path = safe_join(self.static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+
+        if filename.startswith(self.uploads_prefix):
+            # 文件名即内容哈希
+            etag = os.path.splitext(os.path.basename(path))[0]
+            immutable = True
+        else:
+            etag = self.content_hash(path)
+            immutable = request.args.get('v') == etag
+
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        encoding, send_path = self._select_encoding(path)
+        if encoding:
+            etag = f'{etag}-{encoding}'
+
+        response = send_file(send_path, mimetype=mimetype, etag=etag, conditional=True)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+        if os.path.splitext(path)[1] in COMPRESSIBLE_EXTENSIONS:
+            response.vary.add('Accept-Encoding')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+    # 根据Accept-Encoding选择未过期的预压缩文件，返回 (编码, 文件路径)
+    def _select_encoding(self, path):
+        if os.path.splitext(path)[1] not in COMPRESSIBLE_EXTENSIONS:
+            return None, path
+        mtime = os.path.getmtime(path)
+        for encoding, suffix in ENCODINGS:
+            if encoding not in request.accept_encodings:
+                continue
+            compressed = path + suffix
+            if os.path.isfile(compressed) and os.path.getmtime(compressed) >= mtime:
+                return encoding, compressed
+        return None, path
+
+# 为静态目录下的文本资源生成 .gz 和 .br 预压缩文件（内容未变化时跳过），返回生成的文件数
+def compress_static(static_folder):
+    count = 0
+    for dirpath, _, filenames in os.walk(static_folder):
+        for name in filenames:
+            if os.path.splitext(name)[1] not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            path = os.path.join(dirpath, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            mtime = os.path.getmtime(path)
+            outputs = [('.gz', lambda: gzip.compress(data, compresslevel=9, mtime=0))]
+            if brotli is not None:
+                outputs.append(('.br', lambda: brotli.compress(data, quality=11)))
+            for suffix, compress in outputs:
+                target = path + suffix
+                if os.path.isfile(target) and os.path.getmtime(target) >= mtime:
+                    continue
+                with open(target, 'wb') as f:
+                    f.write(compress())
+                count += 1
+    return count
@@ -0,0 +1,144 @@
+from datetime import datetime
+import hashlib
+import os
+import posixpath
+import tempfile
+import time
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Message, UploadBlob, User
+
+# 流式读取上传文件的块大小
+CHUNK_SIZE = 64 * 1024
+
+# 超过该时间（秒）仍未完成的临时文件视为中断的上传，由 gc 删除
+TMP_FILE_MAX_AGE = 3600
+
+# 按内容哈希存储上传文件：相同内容只保存一份，记录引用次数
+# 文件保存在 <blob_dir>/<哈希前两位>/<哈希>.<扩展名>，数据库中保存相对于项目根目录的路径
+# 上传过程中的临时文件写在不对外提供的 tmp_dir 中（需与 blob_dir 位于同一文件系统），完成后移入 blob_dir
+class BlobStore:
+    def __init__(self, root_dir, blob_dir='static/img/uploads', tmp_dir='tmp/uploads'):
+        self.root_dir = root_dir
+        self.blob_dir = blob_dir
+        self.tmp_dir = tmp_dir
+
+    # 路径对应的文件系统绝对路径
+    def abspath(self, path):
+        return os.path.join(self.root_dir, path)
+
+    # 路径是否为去重存储中的文件
+    def owns(self, path):
+        return bool(path) and posixpath.normpath(path).startswith(self.blob_dir + '/')
+
+    # 保存上传文件并增加引用次数，返回文件路径
+    # 边写临时文件边计算哈希，内容已存在时丢弃临时文件
+    def save(self, file_storage, ext):
+        tmp_dir = self.abspath(self.tmp_dir)
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = file_storage.stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+
+            blob_hash = digest.hexdigest()
+            path = self.add_ref(blob_hash, f'{self.blob_dir}/{blob_hash[:2]}/{blob_hash}.{ext}', size)
+            final_path = self.abspath(path)
+            if os.path.exists(final_path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(tmp_path, final_path)
+            return path
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    # 将已有文件移入去重存储并增加count次引用，返回新路径（内容已存在时删除该文件）
+    def import_file(self, file_path, count=1):
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        blob_hash = digest.hexdigest()
+        ext = file_path.rsplit('.', 1)[1].lower() if '.' in os.path.basename(file_path) else 'bin'
+        path = self.add_ref(blob_hash, f'{self.blob_dir}/{blob_hash[:2]}/{blob_hash}.{ext}',
+                            os.path.getsize(file_path), count)
+        final_path = self.abspath(path)
+        if os.path.exists(final_path):
+            os.remove(file_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(file_path, final_path)
+        return path
+
+    # 增加引用次数（不存在时新建记录），返回该内容实际保存的路径
+    def add_ref(self, blob_hash, path, size, count=1):
+        stmt = sqlite_insert(UploadBlob).values(
+            hash=blob_hash, path=path, size=size, ref_count=count, created_at=datetime.utcnow()
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[UploadBlob.hash],
+            set_={'ref_count': UploadBlob.ref_count + count}
+        ).returning(UploadBlob.path)
+        path = db.session.execute(stmt).scalar()
+        db.session.commit()
+        return path
+
+    # 减少引用次数（路径不是去重存储的文件时忽略），调用方需先移除自己持有的引用（用户头像、图片消息）
+    # 引用次数不会低于仍引用该文件的头像和消息数量，释放并未持有的引用不会使其他用户的文件被删除
+    # 引用次数为0的文件由 gc 统一删除，避免与同时进行的上传冲突
+    def release(self, path):
+        if not self.owns(path):
+            return
+        held = (
+            db.session.query(db.func.count()).filter(User.avatar == path).scalar_subquery()
+            + db.session.query(db.func.count()).filter(Message.image == path).scalar_subquery()
+        )
+        UploadBlob.query.filter(UploadBlob.path == path, UploadBlob.ref_count > 0).update(
+            {UploadBlob.ref_count: db.func.max(UploadBlob.ref_count - 1, held)},
+            synchronize_session=False
+        )
+        db.session.commit()
+
+    # 删除引用次数为0的文件及其缩略图等衍生文件，以及中断的上传留下的临时文件，返回删除的文件数
+    def gc(self):
+        removed = self._remove_stale_tmp_files()
+        unused = db.session.query(UploadBlob.hash, UploadBlob.path).filter(UploadBlob.ref_count <= 0).all()
+        for blob in unused:
+            # 仅当删除时引用次数仍为0才删除文件
+            deleted = UploadBlob.query.filter(
+                UploadBlob.hash == blob.hash, UploadBlob.ref_count <= 0
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            if not deleted:
+                continue
+            stem = os.path.splitext(self.abspath(blob.path))[0]
+            for file_path in (self.abspath(blob.path), f'{stem}_thumb.webp', f'{stem}.webp'):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            removed += 1
+        return removed
+
+    # 删除超过 TMP_FILE_MAX_AGE 的临时文件（包括旧版本写在 blob_dir 中的临时文件）
+    def _remove_stale_tmp_files(self):
+        removed = 0
+        cutoff = time.time() - TMP_FILE_MAX_AGE
+        for directory in (self.abspath(self.tmp_dir), self.abspath(self.blob_dir)):
+            if not os.path.isdir(directory):
+                continue
+            for entry in os.scandir(directory):
+                if entry.is_file() and entry.name.endswith('.part') and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+        return removed
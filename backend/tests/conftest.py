@@ -0,0 +1,75 @@
+# 测试使用临时SQLite数据库和假邮件发送方式，需在导入应用之前设置环境变量
+# 运行（在backend目录下）：python -m pytest tests
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_tmp_dir = tempfile.mkdtemp(prefix='can-chat-test-')
+# 在应用注册的退出处理（写入剩余数据）之后删除
+atexit.register(shutil.rmtree, _tmp_dir, ignore_errors=True)
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmp_dir, 'test.db')}"
+os.environ['EMAIL_TRANSPORT'] = 'fake'
+os.environ['MESSAGE_WRITE_MODE'] = 'sync'
+os.environ.pop('SOCKETIO_MESSAGE_QUEUE', None)
+# 测试中发现N+1查询时直接失败
+os.environ['QUERY_REPEAT_ACTION'] = 'raise'
+
+# 测试数据规模：足够让逐行查询超过重复语句上限
+DATASET = {'users': 60, 'channels': 12, 'messages': 3000, 'memberships': 4, 'seed': 1}
+
+@pytest.fixture(scope='session')
+def chat():
+    import app as chat_app
+    chat_app.app.config['TESTING'] = True
+    # 测试客户端的请求都来自同一地址，关闭准入控制
+    chat_app.admission.limits = {}
+    return chat_app
+
+# 生成测试数据集，返回测试对象：消息最多的频道、该频道中加入频道最多的成员
+@pytest.fixture(scope='session')
+def dataset(chat):
+    from datagen import generate_dataset
+    from models import db
+    with chat.app.app_context():
+        generate_dataset(DATASET['users'], DATASET['channels'], DATASET['messages'],
+                         memberships=DATASET['memberships'], seed=DATASET['seed'])
+        channel_id = db.session.execute(db.text(
+            'SELECT channel_id FROM messages GROUP BY channel_id ORDER BY count(*) DESC LIMIT 1'
+        )).scalar()
+        user_id = db.session.execute(db.text(
+            'SELECT uc.user_id FROM user_channels uc JOIN user_channels other ON other.user_id = uc.user_id '
+            'WHERE uc.channel_id = :channel GROUP BY uc.user_id ORDER BY count(*) DESC, uc.user_id LIMIT 1'
+        ), {'channel': channel_id}).scalar()
+        message_ids = db.session.execute(db.text(
+            'SELECT id FROM messages WHERE channel_id = :channel ORDER BY id'
+        ), {'channel': channel_id}).scalars().all()
+    return {'channel_id': channel_id, 'user_id': user_id, 'before_id': message_ids[len(message_ids) // 2]}
+
+# 以测试用户登录的HTTP客户端
+@pytest.fixture
+def client(chat, dataset):
+    client = chat.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = dataset['user_id']
+    return client
+
+# 记录每个请求或事件的SQL语句统计：{名称: QueryLog}
+@pytest.fixture
+def query_logs(chat, monkeypatch):
+    logs = {}
+    end = chat.query_accounting.end
+
+    def record(name):
+        log = end(name)
+        logs[name] = log
+        return log
+
+    monkeypatch.setattr(chat.query_accounting, 'end', record)
+    return logs
@@ -0,0 +1,41 @@
+import pytest
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from admission import AdmissionControl
+
+# 使用很小的限额：突发容量1，几乎不补充令牌
+@pytest.fixture
+def admission(chat, monkeypatch):
+    control = AdmissionControl({
+        'upload_avatar': {'ip': (0.001, 1)},
+        'send_message': {'user': (0.001, 1)},
+    })
+    monkeypatch.setattr(chat, 'admission', control)
+    return control
+
+# 超出限额的HTTP请求返回429和Retry-After（在检查上传文件之前拒绝）
+def test_http_rate_limited(chat, client, admission):
+    assert client.post('/api/upload/avatar').status_code == 400
+    response = client.post('/api/upload/avatar')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) == 1000
+    assert admission.stats()['upload_avatar'] == {'allowed': 1, 'rejected_user': 0, 'rejected_ip': 1}
+
+# 超出限额的Socket.IO事件返回带retry_after的error
+def test_socket_rate_limited(chat, dataset, client, admission):
+    socket = chat.socketio.test_client(chat.app, flask_test_client=client)
+    socket.emit('join_channel', {'channel_id': dataset['channel_id']})
+    socket.get_received()
+    socket.emit('send_message', {'channel_id': dataset['channel_id'], 'content': '第一条'})
+    socket.emit('send_message', {'channel_id': dataset['channel_id'], 'content': '第二条'})
+    events = [event for event in socket.get_received() if event['name'] in ('new_message', 'error')]
+    socket.disconnect()
+    assert [event['name'] for event in events] == ['new_message', 'error']
+    assert events[1]['args'][0]['retry_after'] > 999
+
+# 在反向代理之后（PROXY_HOPS=1）按代理转发的客户端地址分别限流
+def test_rate_limited_per_forwarded_ip(chat, client, admission, monkeypatch):
+    monkeypatch.setattr(chat.app, 'wsgi_app', ProxyFix(chat.app.wsgi_app, x_for=1, x_proto=1))
+    for ip in ('203.0.113.1', '203.0.113.2'):
+        assert client.post('/api/upload/avatar', headers={'X-Forwarded-For': ip}).status_code == 400
+    assert client.post('/api/upload/avatar', headers={'X-Forwarded-For': '203.0.113.1'}).status_code == 429
@@ -0,0 +1,38 @@
+import time
+
+from apis import EmailOutbox, FakeTransport
+
+# 验证码邮件由发件箱后台线程通过假发送方式发送
+def test_verification_email_uses_outbox(chat, client):
+    response = client.post('/api/send_verification_code', json={'email': 'new-user@example.com'})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    transport = chat.email_outbox.transport
+    assert isinstance(transport, FakeTransport)
+    deadline = time.monotonic() + 5
+    while not any(email['to'] == 'new-user@example.com' for email in transport.sent):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+# 发送失败时按退避时间重试
+def test_outbox_retries_failed_sends():
+    class FlakyTransport(FakeTransport):
+        def __init__(self):
+            super().__init__()
+            self.failures = 2
+
+        def send(self, to, subject, html):
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError('temporary failure')
+            super().send(to, subject, html)
+
+    transport = FlakyTransport()
+    outbox = EmailOutbox(transport, backoff=0.01)
+    outbox.start()
+    assert outbox.enqueue('retry@example.com', 'subject', 'html')
+    deadline = time.monotonic() + 5
+    while not transport.sent:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    outbox.shutdown()
+    assert transport.sent[0]['to'] == 'retry@example.com'
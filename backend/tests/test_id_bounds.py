@@ -0,0 +1,38 @@
+import pytest
+
+# 超出64位整数范围的参数
+HUGE = 99999999999999999999
+
+# 超出范围的ID和偏移量按上限处理，不会使查询出错
+@pytest.mark.parametrize('template', (
+    '/api/channels/{channel_id}/messages?before_id={huge}',
+    '/api/channels/{channel_id}/messages?after_id={huge}',
+    '/api/channels/{channel_id}/messages/search?q=abc&offset={huge}',
+    '/api/channels/search?q=abc&offset={huge}',
+    '/api/users?ids={user_id},{huge}',
+))
+def test_huge_query_parameters(chat, dataset, client, template):
+    response = client.get(template.format(huge=HUGE, **dataset))
+    assert response.status_code == 200, response.get_data(as_text=True)
+
+def test_huge_after_id_returns_no_messages(chat, dataset, client):
+    data = client.get(f"/api/channels/{dataset['channel_id']}/messages?after_id={HUGE}").get_json()
+    assert data['messages'] == []
+
+# 路由中超出范围的频道ID返回404
+@pytest.mark.parametrize('method, template', (
+    ('get', '/api/channels/{huge}'),
+    ('get', '/api/channels/{huge}/messages'),
+    ('post', '/api/channels/{huge}/join'),
+))
+def test_huge_route_ids(chat, dataset, client, method, template):
+    assert getattr(client, method)(template.format(huge=HUGE)).status_code == 404
+
+# 重连补发时超出范围的last_seen_id同样按上限处理（从数据库补发）
+def test_huge_last_seen_id(chat, dataset, client):
+    chat.recent_messages.invalidate_channels([dataset['channel_id']])
+    socket = chat.socketio.test_client(chat.app, flask_test_client=client)
+    socket.emit('join_channel', {'channel_id': dataset['channel_id'], 'last_seen_id': HUGE})
+    replay = [event for event in socket.get_received() if event['name'] == 'channel_replay']
+    socket.disconnect()
+    assert replay and replay[0]['args'][0]['messages'] == []
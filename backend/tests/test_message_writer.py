@@ -0,0 +1,90 @@
+import pytest
+
+from message_writer import MessageWriter
+from models import db, Channel, Message, UserChannel
+
+# 每种写入模式使用独立的写入管道和新建的频道
+@pytest.fixture(params=['sync', 'batched'])
+def writer(request, chat, monkeypatch):
+    writer = MessageWriter(chat.app, mode=request.param, batch_size=10, flush_interval=0.05)
+    writer.start()
+    monkeypatch.setattr(chat, 'message_writer', writer)
+    yield writer
+    writer.shutdown()
+
+@pytest.fixture
+def channel_id(chat, dataset):
+    with chat.app.app_context():
+        channel = Channel(name='写入测试', created_by=dataset['user_id'], member_count=1)
+        db.session.add(channel)
+        db.session.commit()
+        channel_id = channel.id
+        db.session.add(UserChannel(user_id=dataset['user_id'], channel_id=channel_id))
+        db.session.commit()
+    # 与加入频道接口一样使成员关系缓存失效
+    chat.membership_cache.invalidate(dataset['user_id'])
+    return channel_id
+
+def socket_client(chat, client):
+    socket = chat.socketio.test_client(chat.app, flask_test_client=client)
+    assert socket.is_connected()
+    return socket
+
+def received(socket, name):
+    return [event['args'][0] for event in socket.get_received() if event['name'] == name]
+
+# 发送的消息立即广播，ID按发送顺序递增，写入数据库后内容一致
+def test_send_message(chat, client, writer, channel_id):
+    socket = socket_client(chat, client)
+    socket.emit('join_channel', {'channel_id': channel_id})
+    for n in range(5):
+        socket.emit('send_message', {'channel_id': channel_id, 'content': f'消息{n}'})
+    messages = received(socket, 'new_message')
+    assert [message['content'] for message in messages] == [f'消息{n}' for n in range(5)]
+    ids = [message['id'] for message in messages]
+    assert ids == sorted(ids)
+
+    writer.flush()
+    with chat.app.app_context():
+        stored = db.session.query(Message.id, Message.content).filter(Message.channel_id == channel_id).order_by(Message.id).all()
+    assert [(row.id, row.content) for row in stored] == [(message['id'], message['content']) for message in messages]
+    socket.disconnect()
+
+# 重连时补发last_seen_id之后的消息（批量写入模式下包括尚未写入数据库的消息）
+def test_replay_after_reconnect(chat, client, writer, channel_id):
+    sender = socket_client(chat, client)
+    sender.emit('join_channel', {'channel_id': channel_id})
+    sender.emit('send_message', {'channel_id': channel_id, 'content': '断线前'})
+    last_seen_id = received(sender, 'new_message')[0]['id']
+    for n in range(3):
+        sender.emit('send_message', {'channel_id': channel_id, 'content': f'断线后{n}'})
+
+    receiver = socket_client(chat, client)
+    receiver.emit('join_channel', {'channel_id': channel_id, 'last_seen_id': last_seen_id})
+    replay, = received(receiver, 'channel_replay')
+    assert [message['content'] for message in replay['messages']] == [f'断线后{n}' for n in range(3)]
+    assert replay['has_more'] is False
+
+    # 缓存清除后从数据库补发
+    writer.flush()
+    chat.recent_messages.invalidate_channels([channel_id])
+    receiver.emit('join_channel', {'channel_id': channel_id, 'last_seen_id': last_seen_id})
+    replay, = received(receiver, 'channel_replay')
+    assert [message['content'] for message in replay['messages']] == [f'断线后{n}' for n in range(3)]
+    sender.disconnect()
+    receiver.disconnect()
+
+# 非文本或过长的消息内容在写入之前拒绝，不影响同一批的其他消息
+def test_invalid_content_rejected(chat, client, writer, channel_id):
+    socket = socket_client(chat, client)
+    socket.emit('join_channel', {'channel_id': channel_id})
+    socket.emit('send_message', {'channel_id': channel_id, 'content': {'evil': 1}})
+    socket.emit('send_message', {'channel_id': channel_id, 'content': 'x' * (chat.MESSAGE_MAX_LENGTH + 1)})
+    socket.emit('send_message', {'channel_id': channel_id, 'content': '正常消息'})
+    events = socket.get_received()
+    assert [event['name'] for event in events if event['name'] in ('error', 'new_message')] == ['error', 'error', 'new_message']
+
+    writer.flush()
+    with chat.app.app_context():
+        assert [row.content for row in Message.query.filter_by(channel_id=channel_id)] == ['正常消息']
+    socket.disconnect()
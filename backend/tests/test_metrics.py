@@ -0,0 +1,24 @@
+import pytest
+
+REMOTE = {'REMOTE_ADDR': '203.0.113.7'}
+
+# 未配置令牌时只允许本机直接访问
+@pytest.mark.parametrize('environ, headers, status', (
+    ({}, {}, 200),
+    (REMOTE, {}, 403),
+    ({}, {'X-Forwarded-For': '203.0.113.7'}, 403),
+))
+def test_metrics_local_only(chat, environ, headers, status):
+    response = chat.app.test_client().get('/api/metrics', environ_base=environ, headers=headers)
+    assert response.status_code == status
+
+# 配置了令牌时按令牌校验，与来源地址无关
+@pytest.mark.parametrize('environ, headers, status', (
+    (REMOTE, {'Authorization': 'Bearer secret'}, 200),
+    (REMOTE, {'Authorization': 'Bearer wrong'}, 403),
+    ({}, {}, 403),
+))
+def test_metrics_token(chat, monkeypatch, environ, headers, status):
+    monkeypatch.setitem(chat.app.config, 'METRICS_TOKEN', 'secret')
+    response = chat.app.test_client().get('/api/metrics', environ_base=environ, headers=headers)
+    assert response.status_code == status
@@ -0,0 +1,47 @@
+import pytest
+
+from models import User
+from query_accounting import RepeatedQueryError
+
+# 预先加载频道的最新一页消息到最近消息缓存
+def warm_recent_messages(chat, subject):
+    with chat.app.app_context():
+        chat.recent_messages.latest_page(subject['channel_id'], chat.MESSAGE_PAGE_SIZE)
+
+# 列表和历史记录接口每个请求的SQL语句上限，与消息数、成员数无关
+# (接口地址模板, 路由, 语句上限, 请求前的准备操作)
+BUDGETS = (
+    ('/api/channels/public', 'GET /api/channels/public', 1, None),
+    # 未读数量查询之前先写入该用户待提交的已读位置
+    ('/api/channels/joined', 'GET /api/channels/joined', 2, None),
+    ('/api/channels/{channel_id}', 'GET /api/channels/<int:channel_id>', 2, None),
+    # 清除最近消息缓存，测量数据库查询路径
+    ('/api/channels/{channel_id}/messages', 'GET /api/channels/<int:channel_id>/messages', 1,
+     lambda chat, subject: chat.recent_messages.invalidate_channels([subject['channel_id']])),
+    # 最新一页由最近消息缓存返回
+    ('/api/channels/{channel_id}/messages', 'GET /api/channels/<int:channel_id>/messages', 0, warm_recent_messages),
+    ('/api/channels/{channel_id}/messages?before_id={before_id}', 'GET /api/channels/<int:channel_id>/messages', 1, None),
+)
+
+@pytest.mark.parametrize('template, route, budget, before_request', BUDGETS)
+def test_statement_budget(chat, dataset, client, query_logs, template, route, budget, before_request):
+    if before_request is not None:
+        before_request(chat, dataset)
+    response = client.get(template.format(**dataset))
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert query_logs[route].count <= budget, query_logs[route].by_shape()
+
+# 历史记录每页包含多个发送者，发送者资料仍只需一次查询
+def test_history_page_has_several_senders(chat, dataset, client):
+    data = client.get(f"/api/channels/{dataset['channel_id']}/messages?before_id={dataset['before_id']}").get_json()
+    assert len(data['users']) > 1
+
+# 循环中逐行查询超过上限时，测试模式下抛出RepeatedQueryError
+def test_repeated_queries_raise(chat, dataset):
+    limit = chat.query_accounting.repeat_limit
+    with chat.app.test_request_context('/n-plus-one'):
+        chat.query_accounting.begin()
+        for user_id in range(1, limit + 3):
+            User.query.filter_by(id=user_id).first()
+        with pytest.raises(RepeatedQueryError):
+            chat.query_accounting.end('GET /n-plus-one')
@@ -0,0 +1,31 @@
+from models import db, UserChannel
+from read_markers import latest_message_id
+
+def joined_channel(client, channel_id):
+    channels = client.get('/api/channels/joined').get_json()['channels']
+    return next(channel for channel in channels if channel['id'] == channel_id)
+
+# 已读位置不超过频道内最新的消息，之后的新消息仍计为未读
+def test_mark_read_beyond_latest_message(chat, dataset, client):
+    channel_id = dataset['channel_id']
+    response = client.post(f'/api/channels/{channel_id}/read', json={'message_id': 2**70})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    with chat.app.app_context():
+        latest = latest_message_id(channel_id)
+    assert joined_channel(client, channel_id)['last_read_message_id'] == latest
+
+    with chat.app.app_context():
+        chat.message_writer.write(content='新消息', sender_id=dataset['user_id'], channel_id=channel_id)
+    assert joined_channel(client, channel_id)['unread_count'] == 1
+
+# 批量写入失败时逐条写入，写入失败的记录被丢弃，不再影响之后的写入
+def test_flush_drops_failing_markers(chat, dataset):
+    user_id = dataset['user_id']
+    with chat.app.app_context():
+        channel_ids = [row.channel_id for row in UserChannel.query.filter_by(user_id=user_id).limit(2)]
+        valid_id = latest_message_id(channel_ids[1])
+        chat.read_markers.mark(user_id, channel_ids[0], 2**70)
+        chat.read_markers.mark(user_id, channel_ids[1], valid_id)
+        assert chat.read_markers.flush(user_id=user_id) == 1
+        assert db.session.get(UserChannel, (user_id, channel_ids[1])).last_read_message_id == valid_id
+        assert chat.read_markers.flush(user_id=user_id) == 0
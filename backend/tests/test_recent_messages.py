@@ -0,0 +1,15 @@
+from serializers import build_message_payload, get_sender, serialize_profile
+
+# 在加载数据库之后才追加的消息（已包含在加载结果中）在历史记录中只出现一次
+def test_append_after_seed_is_not_duplicated(chat, dataset, client):
+    channel_id = dataset['channel_id']
+    with chat.app.app_context():
+        message = chat.message_writer.write(content='追加前已写入', sender_id=dataset['user_id'], channel_id=channel_id)
+        chat.recent_messages.invalidate_channels([channel_id])
+        chat.recent_messages.latest_page(channel_id, chat.MESSAGE_PAGE_SIZE)
+        sender = get_sender(dataset['user_id'])
+        chat.recent_messages.append(build_message_payload(message, sender), serialize_profile(sender))
+
+    messages = client.get(f'/api/channels/{channel_id}/messages').get_json()['messages']
+    assert [m['id'] for m in messages].count(message.id) == 1
+    assert messages[-1]['id'] == message.id
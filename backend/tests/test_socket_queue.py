@@ -0,0 +1,21 @@
+import shutil
+import tempfile
+
+from socket_queue import UnixSocketManager
+
+# 本地跨进程广播：一个进程发布的消息由同一目录下的其他进程收到
+# （Unix套接字路径长度有限，不使用pytest的tmp_path）
+def test_unix_socket_manager_publishes_to_peers():
+    directory = tempfile.mkdtemp(prefix='cc-sock-')
+    url = f'unix://{directory}'
+    managers = [UnixSocketManager(url), UnixSocketManager(url)]
+    for manager in managers:
+        manager.sock = manager.socket_module.socket(manager.socket_module.AF_UNIX, manager.socket_module.SOCK_DGRAM)
+        manager.sock.bind(manager.path)
+    try:
+        managers[0]._publish({'method': 'emit', 'event': 'new_message', 'data': {'id': 1}})
+        assert next(managers[1]._listen()) == {'method': 'emit', 'event': 'new_message', 'data': {'id': 1}}
+    finally:
+        for manager in managers:
+            manager.close()
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,45 @@
+import io
+
+import pytest
+
+from models import UploadBlob
+from storage import BlobStore
+
+# 上传文件保存到临时目录，不写入项目的静态目录
+@pytest.fixture
+def blob_store(chat, monkeypatch, tmp_path):
+    store = BlobStore(str(tmp_path), chat.app.config['UPLOAD_BLOB_DIR'])
+    monkeypatch.setattr(chat, 'blob_store', store)
+    return store
+
+def ref_count(chat, path):
+    with chat.app.app_context():
+        return UploadBlob.query.filter_by(path=path).one().ref_count
+
+# 重新上传当前头像不增加引用次数
+def test_reupload_current_avatar(chat, client, blob_store):
+    paths = []
+    for _ in range(3):
+        response = client.post('/api/upload/avatar', data={'avatar': (io.BytesIO(b'same avatar'), 'a.png')})
+        assert response.status_code == 200, response.get_data(as_text=True)
+        paths.append(response.get_json()['avatar'])
+    assert len(set(paths)) == 1
+    assert ref_count(chat, paths[0]) == 1
+
+def test_profile_avatar_must_be_string(chat, client):
+    assert client.put('/api/user', json={'avatar': 5}).status_code == 400
+
+# 图片已保存但消息写入失败时释放图片的引用
+def test_failed_image_message_releases_blob(chat, dataset, client, blob_store, monkeypatch):
+    def fail(**fields):
+        raise RuntimeError('write failed')
+
+    monkeypatch.setattr(chat.message_writer, 'write', fail)
+    response = client.post('/api/send_image_message', data={
+        'channel_id': str(dataset['channel_id']),
+        'image': (io.BytesIO(b'orphan image'), 'b.png'),
+    })
+    assert response.status_code == 500
+    with chat.app.app_context():
+        blob = UploadBlob.query.filter(UploadBlob.path.like('%.png')).filter_by(size=len(b'orphan image')).one()
+        assert blob.ref_count == 0
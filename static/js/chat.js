@@ -2,6 +2,18 @@
 let socket = null;
 let currentUser = null;
 let currentChannel = null;
+let messageCursor = null;
+let loadingOlderMessages = false;
+let searchTimer = null;
+const SEARCH_DEBOUNCE_MS = 300;
+// 消息发送者资料缓存：用户ID -> {id, nickname, avatar, version}
+let userProfiles = {};
+// 正在请求中的用户资料：用户ID -> Promise
+let pendingProfiles = {};
+// 当前频道在线的用户ID
+let onlineUsers = new Set();
+// 新消息按到达顺序显示（等待补全发送者资料时不打乱顺序）
+let incomingMessages = Promise.resolve();
 let channels = {
     joined: [],
     public: []
@@ -64,6 +76,10 @@ function initWebSocket() {
     // 连接成功
     socket.on('connect', () => {
         console.log('WebSocket连接成功');
+        // 重连后重新加入当前频道，并补发断线期间错过的消息
+        if (currentChannel) {
+            joinChannelRoom(currentChannel.id);
+        }
     });
     
     // 连接断开
@@ -73,7 +89,40 @@ function initWebSocket() {
     
     // 接收新消息
     socket.on('new_message', (message) => {
-        displayMessage(message);
+        // 其他频道的消息只增加未读数量
+        if (!currentChannel || currentChannel.id !== message.channel_id) {
+            if (message.sender_id !== currentUser.id) {
+                incrementUnread(message.channel_id);
+            }
+            return;
+        }
+        incomingMessages = incomingMessages.then(async () => {
+            await ensureUserProfiles([message]);
+            if (!isMessageDisplayed(message.id)) {
+                displayMessage(message);
+            }
+            markChannelRead(message.channel_id, message.id);
+        });
+    });
+    
+    // 加入频道后补发的消息
+    socket.on('channel_replay', (replay) => {
+        incomingMessages = incomingMessages.then(() => handleChannelReplay(replay));
+    });
+    
+    // 频道在线用户变化
+    socket.on('presence_diff', (diff) => {
+        handlePresenceDiff(diff);
+    });
+    
+    // 用户昵称或头像变更
+    socket.on('user_profile_updated', (profile) => {
+        handleUserProfileUpdated(profile);
+    });
+    
+    // 图片消息缩略图生成完成
+    socket.on('message_media_ready', (media) => {
+        handleMessageMediaReady(media);
     });
     
     // 接收系统通知
@@ -173,6 +222,7 @@ function createChannelElement(channel) {
         <h4>${channel.name}</h4>
         <p>${channel.description || '暂无描述'}</p>
         <span class="user-count">${channel.user_count} 人</span>
+        ${channel.unread_count > 0 ? `<span class="unread-badge">${channel.unread_count}</span>` : ''}
     `;
     
     // 添加点击事件
@@ -202,15 +252,103 @@ async function selectChannel(channel) {
     // 加载频道消息历史
     await loadChannelMessages();
     
-    // 加入WebSocket房间
-    socket.emit('join_channel', {
-        channel_id: channel.id
-    });
+    // 标记已读到最新一条消息
+    if (messageCursor && messageCursor.after_id) {
+        markChannelRead(channel.id, messageCursor.after_id);
+    }
+    
+    // 加入WebSocket房间（同时补发加载历史之后到达的消息）
+    joinChannelRoom(channel.id);
+    
+    // 加载在线用户
+    await loadChannelPresence();
     
     // 启用消息输入框
     enableMessageInput();
 }
 
+// 加入频道的WebSocket房间，已加载过消息时带上最后一条消息ID以补发之后的消息
+function joinChannelRoom(channelId) {
+    const data = {channel_id: channelId};
+    if (messageCursor) {
+        data.last_seen_id = messageCursor.after_id || 0;
+    }
+    socket.emit('join_channel', data);
+}
+
+// 显示补发的消息；错过的消息过多时重新加载历史
+async function handleChannelReplay(replay) {
+    if (!currentChannel || currentChannel.id !== replay.channel_id) {
+        return;
+    }
+    if (replay.has_more) {
+        await loadChannelMessages();
+        return;
+    }
+    mergeUserProfiles(replay.users);
+    await ensureUserProfiles(replay.messages);
+    replay.messages.forEach(message => {
+        if (!isMessageDisplayed(message.id)) {
+            displayMessage(message);
+        }
+    });
+    if (replay.messages.length > 0) {
+        markChannelRead(replay.channel_id, replay.messages[replay.messages.length - 1].id);
+    }
+}
+
+// 消息是否已经显示
+function isMessageDisplayed(messageId) {
+    return document.querySelector(`.message-item[data-message-id="${messageId}"]`) !== null;
+}
+
+// 标记频道已读到指定消息（服务器端合并后延迟写入）
+function markChannelRead(channelId, messageId) {
+    const joined = channels.joined.find(ch => ch.id === channelId);
+    if (!joined) {
+        return;
+    }
+    if (!joined.last_read_message_id || joined.last_read_message_id < messageId) {
+        joined.last_read_message_id = messageId;
+        socket.emit('mark_read', {
+            channel_id: channelId,
+            message_id: messageId
+        });
+    }
+    if (joined.unread_count) {
+        joined.unread_count = 0;
+        updateUnreadBadge(joined);
+    }
+}
+
+// 其他频道收到新消息时增加未读数量
+function incrementUnread(channelId) {
+    const joined = channels.joined.find(ch => ch.id === channelId);
+    if (joined) {
+        joined.unread_count = (joined.unread_count || 0) + 1;
+        updateUnreadBadge(joined);
+    }
+}
+
+// 更新已加入频道列表中的未读数量
+function updateUnreadBadge(channel) {
+    const channelDiv = document.querySelector(`#joined-channels-list [data-channel-id="${channel.id}"]`);
+    if (!channelDiv) {
+        return;
+    }
+    let badge = channelDiv.querySelector('.unread-badge');
+    if (channel.unread_count > 0) {
+        if (!badge) {
+            badge = document.createElement('span');
+            badge.className = 'unread-badge';
+            channelDiv.appendChild(badge);
+        }
+        badge.textContent = channel.unread_count;
+    } else if (badge) {
+        badge.remove();
+    }
+}
+
 // 更新频道头部信息
 function updateChannelHeader() {
     document.getElementById('current-channel-name').textContent = currentChannel.name;
@@ -230,10 +368,49 @@ function updateChannelHeader() {
     }
 }
 
-// 加载频道消息历史
+// 加载当前频道的在线用户，之后由presence_diff事件增量更新
+async function loadChannelPresence() {
+    onlineUsers = new Set();
+    renderOnlineCount();
+    const channelId = currentChannel.id;
+    
+    try {
+        const response = await fetch(`/api/channels/${channelId}/presence`, {
+            credentials: 'include'
+        });
+        
+        const data = await response.json();
+        
+        if (data.status === 'success' && currentChannel && currentChannel.id === channelId) {
+            // 加入房间与请求之间可能已收到变化，合并而不是覆盖
+            data.online.forEach(userId => onlineUsers.add(userId));
+            renderOnlineCount();
+        }
+    } catch (error) {
+        console.error('加载在线用户失败:', error);
+    }
+}
+
+// 应用在线用户变化
+function handlePresenceDiff(diff) {
+    if (!currentChannel || currentChannel.id !== diff.channel_id) {
+        return;
+    }
+    diff.online.forEach(userId => onlineUsers.add(userId));
+    diff.offline.forEach(userId => onlineUsers.delete(userId));
+    renderOnlineCount();
+}
+
+// 显示在线人数
+function renderOnlineCount() {
+    document.getElementById('channel-online-count').textContent = onlineUsers.size > 0 ? `${onlineUsers.size} 人在线` : '';
+}
+
+// 加载频道消息历史（最新一页）
 async function loadChannelMessages() {
     const messagesContainer = document.getElementById('messages');
     messagesContainer.innerHTML = '<div class="loading">加载消息中...</div>';
+    messageCursor = null;
     
     try {
         const response = await fetch(`/api/channels/${currentChannel.id}/messages`, {
@@ -245,6 +422,8 @@ async function loadChannelMessages() {
         messagesContainer.innerHTML = '';
         
         if (data.status === 'success') {
+            messageCursor = data.cursor;
+            mergeUserProfiles(data.users);
             data.messages.forEach(message => {
                 displayMessage(message);
             });
@@ -258,28 +437,138 @@ async function loadChannelMessages() {
     }
 }
 
+// 加载更早的消息（滚动到顶部时触发）
+async function loadOlderMessages() {
+    if (!currentChannel || !messageCursor || !messageCursor.has_more || loadingOlderMessages) {
+        return;
+    }
+    
+    loadingOlderMessages = true;
+    const channelId = currentChannel.id;
+    
+    try {
+        const response = await fetch(`/api/channels/${channelId}/messages?before_id=${messageCursor.before_id}`, {
+            credentials: 'include'
+        });
+        
+        const data = await response.json();
+        
+        // 请求期间切换了频道则丢弃结果
+        if (data.status === 'success' && currentChannel && currentChannel.id === channelId) {
+            const messagesContainer = document.getElementById('messages');
+            const scrollContainer = document.getElementById('messages-container');
+            const previousHeight = scrollContainer.scrollHeight;
+            
+            mergeUserProfiles(data.users);
+            const fragment = document.createDocumentFragment();
+            data.messages.forEach(message => {
+                fragment.appendChild(createMessageElement(message));
+            });
+            messagesContainer.insertBefore(fragment, messagesContainer.firstChild);
+            
+            // 保持当前阅读位置
+            scrollContainer.scrollTop += scrollContainer.scrollHeight - previousHeight;
+            messageCursor = {
+                ...messageCursor,
+                before_id: data.cursor.before_id,
+                has_more: data.cursor.has_more
+            };
+        }
+    } catch (error) {
+        console.error('加载更早消息失败:', error);
+    } finally {
+        loadingOlderMessages = false;
+    }
+}
+
+// 合并服务器返回的用户资料（只保留版本较新的资料）
+function mergeUserProfiles(users) {
+    Object.values(users || {}).forEach(profile => {
+        const cached = userProfiles[profile.id];
+        if (!cached || cached.version <= profile.version) {
+            userProfiles[profile.id] = profile;
+        }
+    });
+}
+
+// 补全消息发送者中缓存缺失或版本过期的用户资料
+async function ensureUserProfiles(messages) {
+    const missing = [...new Set(messages
+        .filter(message => {
+            const cached = userProfiles[message.sender_id];
+            return !cached || cached.version < message.sender_version;
+        })
+        .map(message => message.sender_id))];
+    
+    const requestIds = missing.filter(id => !pendingProfiles[id]);
+    if (requestIds.length > 0) {
+        const request = fetch(`/api/users?ids=${requestIds.join(',')}`, {
+            credentials: 'include'
+        })
+            .then(response => response.json())
+            .then(data => {
+                if (data.status === 'success') {
+                    mergeUserProfiles(data.users);
+                }
+            })
+            .catch(error => console.error('获取用户资料失败:', error))
+            .finally(() => requestIds.forEach(id => delete pendingProfiles[id]));
+        requestIds.forEach(id => pendingProfiles[id] = request);
+    }
+    
+    await Promise.all(missing.map(id => pendingProfiles[id]).filter(Boolean));
+}
+
+// 用户资料变更后更新缓存及已显示的消息
+function handleUserProfileUpdated(profile) {
+    mergeUserProfiles({[profile.id]: profile});
+    const current = userProfiles[profile.id];
+    document.querySelectorAll(`.message-item[data-sender-id="${profile.id}"]`).forEach(messageDiv => {
+        messageDiv.querySelector('.message-avatar').innerHTML = createSenderAvatarHtml(current);
+        messageDiv.querySelector('.message-sender').textContent = current.nickname;
+    });
+}
+
+// 构建发送者头像HTML
+function createSenderAvatarHtml(sender) {
+    if (sender.avatar) {
+        // 显示实际头像图片
+        return `<img src="/${sender.avatar}" alt="${escapeHtml(sender.nickname)}" class="message-avatar-img">`;
+    }
+    // 显示文字头像作为默认值
+    return `<div class="message-avatar-text">${escapeHtml(sender.nickname.charAt(0))}</div>`;
+}
+
 // 显示消息
 function displayMessage(message) {
     const messagesContainer = document.getElementById('messages');
+    messagesContainer.appendChild(createMessageElement(message));
+    // 记录最后一条消息ID，重连时据此补发
+    if (messageCursor && (!messageCursor.after_id || messageCursor.after_id < message.id)) {
+        messageCursor.after_id = message.id;
+    }
+    scrollToBottom();
+}
+
+// 创建消息元素
+function createMessageElement(message) {
     const messageDiv = document.createElement('div');
     
     // 检查是否是自己发送的消息
     const isOwnMessage = message.sender_id === currentUser.id;
     
     messageDiv.className = `message-item ${isOwnMessage ? 'own' : ''}`;
+    messageDiv.dataset.senderId = message.sender_id;
+    messageDiv.dataset.messageId = message.id;
     
     // 格式化时间
     const time = new Date(message.created_at).toLocaleTimeString();
     
+    // 发送者资料（来自用户资料缓存）
+    const sender = userProfiles[message.sender_id] || {nickname: '未知用户', avatar: null};
+    
     // 构建头像HTML
-    let avatarHtml = '';
-    if (message.sender_avatar) {
-        // 显示实际头像图片
-        avatarHtml = `<img src="/${message.sender_avatar}" alt="${message.sender_nickname}" class="message-avatar-img">`;
-    } else {
-        // 显示文字头像作为默认值
-        avatarHtml = `<div class="message-avatar-text">${message.sender_nickname.charAt(0)}</div>`;
-    }
+    const avatarHtml = createSenderAvatarHtml(sender);
     
     // 构建消息内容HTML
     let messageContentHtml = '';
@@ -287,7 +576,7 @@ function displayMessage(message) {
         // 图片消息
         messageContentHtml = `
             <div class="message-header">
-                <span class="message-sender">${message.sender_nickname}</span>
+                <span class="message-sender">${escapeHtml(sender.nickname)}</span>
                 <span class="message-time">${time}</span>
             </div>
         `;
@@ -296,12 +585,12 @@ function displayMessage(message) {
             messageContentHtml += `<div class="message-text">${escapeHtml(message.content)}</div>`;
         }
         
-        messageContentHtml += `<img src="/${message.image}" alt="图片消息" class="message-image">`;
+        messageContentHtml += createMessageImageHtml(message);
     } else {
         // 文本消息
         messageContentHtml = `
             <div class="message-header">
-                <span class="message-sender">${message.sender_nickname}</span>
+                <span class="message-sender">${escapeHtml(sender.nickname)}</span>
                 <span class="message-time">${time}</span>
             </div>
             <div class="message-text">${escapeHtml(message.content)}</div>
@@ -315,8 +604,30 @@ function displayMessage(message) {
         </div>
     `;
     
-    messagesContainer.appendChild(messageDiv);
-    scrollToBottom();
+    return messageDiv;
+}
+
+// 构建图片消息HTML：优先显示缩略图，点击查看原图；缩略图生成中时先显示占位
+function createMessageImageHtml(message) {
+    if (message.media_pending) {
+        return `<div class="message-image message-image-pending" data-message-id="${message.id}" data-full="/${message.image}">图片处理中...</div>`;
+    }
+    const src = message.thumbnail || message.image_webp || message.image;
+    return `<img src="/${src}" data-full="/${message.image_webp || message.image}" alt="图片消息" class="message-image">`;
+}
+
+// 缩略图生成完成后替换占位
+function handleMessageMediaReady(media) {
+    const placeholder = document.querySelector(`.message-image-pending[data-message-id="${media.id}"]`);
+    if (!placeholder) {
+        return;
+    }
+    const img = document.createElement('img');
+    img.className = 'message-image';
+    img.alt = '图片消息';
+    img.src = media.thumbnail ? `/${media.thumbnail}` : placeholder.dataset.full;
+    img.dataset.full = media.image_webp ? `/${media.image_webp}` : placeholder.dataset.full;
+    placeholder.replaceWith(img);
 }
 
 // 显示系统消息
@@ -477,6 +788,7 @@ function resetChannelHeader() {
     document.getElementById('current-channel-name').textContent = '选择一个频道开始聊天';
     document.getElementById('current-channel-description').textContent = '';
     document.getElementById('channel-user-count').textContent = '';
+    document.getElementById('channel-online-count').textContent = '';
     document.getElementById('channel-action-btn').textContent = '';
     document.getElementById('channel-action-btn').onclick = null;
     
@@ -674,9 +986,16 @@ function bindEventListeners() {
     if (searchInput) {
         searchInput.addEventListener('keypress', (e) => {
             if (e.key === 'Enter') {
+                clearTimeout(searchTimer);
                 searchChannels();
             }
         });
+        
+        // 输入时自动搜索（防抖）
+        searchInput.addEventListener('input', () => {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(searchChannels, SEARCH_DEBOUNCE_MS);
+        });
     }
     
     // 登出按钮
@@ -711,6 +1030,26 @@ function bindEventListeners() {
         });
     });
     
+    // 点击图片消息查看原图
+    const messagesList = document.getElementById('messages');
+    if (messagesList) {
+        messagesList.addEventListener('click', (e) => {
+            if (e.target.matches('img.message-image')) {
+                window.open(e.target.dataset.full, '_blank');
+            }
+        });
+    }
+    
+    // 消息区域滚动到顶部时加载更早的消息
+    const messagesScroll = document.getElementById('messages-container');
+    if (messagesScroll) {
+        messagesScroll.addEventListener('scroll', () => {
+            if (messagesScroll.scrollTop < 50) {
+                loadOlderMessages();
+            }
+        });
+    }
+    
     // 图片按钮点击事件
     const imageBtn = document.getElementById('image-btn');
     if (imageBtn) {